@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import platform
+import tempfile
+import numpy as np
+
+import imageStream
+import decode
+import decoderCalibration
+
+# Default image sizes (width, height): 8x8 up to 1024x1024, including sizes
+# that aren't multiples of any tile size
+DEFAULT_SIZES = [(8, 8), (13, 7), (64, 64), (100, 60), (256, 256), (500, 300), (1024, 1024)]
+QUICK_SIZES = [(8, 8), (13, 7), (64, 64), (100, 60)]
+
+# Stages timed for every (format, size)
+STAGES = ("parse", "extract", "decode", "save")
+
+# Timings shorter than this are mostly timer noise and aren't checked for regressions
+MIN_COMPARE_SECONDS = 1e-4
+
+# -----------------------------------------------------------------------------
+#                           SYNTHETIC TPL GENERATOR
+# -----------------------------------------------------------------------------
+
+def synthetic_tpl(images, seed=0):
+    """
+    Build a TPL file in memory with random pixel data.
+    images is a list of (format, width, height); C4/C8/C14X2 images get a
+    random RGB5A3 palette with one entry per possible index (capped at 4096).
+    Layout: header, image table, then per image a 36-byte image header,
+    optional 12-byte palette header, palette and pixel data, 32-byte aligned.
+    """
+    rng = np.random.default_rng(seed)
+    n_images = len(images)
+    out = bytearray(struct.pack(">III", imageStream.TPL_MAGIC, n_images, 0x0C))
+    out += bytes(8 * n_images)
+
+    def align():
+        out.extend(bytes(-len(out) % 32))
+
+    for img_idx, (format, width, height) in enumerate(images):
+        align()
+        header_offset = len(out)
+        out += bytes(36)
+        palette_offset = 0
+        if format in (imageStream.IMG_FMT_C4, imageStream.IMG_FMT_C8, imageStream.IMG_FMT_C14X2):
+            palette_offset = len(out)
+            out += bytes(12)
+            n_entries = min(1 << imageStream.FORMAT_TILES[format][2], 4096)
+            align()
+            palette_addr = len(out)
+            out += rng.integers(0, 256, size=n_entries * 2, dtype=np.uint8).tobytes()
+            struct.pack_into(">HBBII", out, palette_offset, n_entries, 0, 0, imageStream.PAL_FMT_RGB5A3, palette_addr)
+
+        align()
+        data_addr = len(out)
+        out += rng.integers(0, 256, size=imageStream.image_size(format, width, height), dtype=np.uint8).tobytes()
+
+        struct.pack_into(">HHIIIIIIfBBBB", out, header_offset, height, width, format, data_addr,
+                         0, 0, 1, 1, 0.0, 0, 0, 0, 0)
+        struct.pack_into(">II", out, 0x0C + img_idx * 8, header_offset, palette_offset)
+    return bytes(out)
+
+# -----------------------------------------------------------------------------
+#                           TIMING
+# -----------------------------------------------------------------------------
+
+def best_time(func, repeat):
+    """
+    Fastest of `repeat` runs of func(), in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_case(format, width, height, workdir, repeat, backend=None):
+    """
+    Time every stage for one synthetic single-image TPL, decoding with backend
+    (one of imageStream.BACKENDS, default: decode.DEFAULT_BACKEND).
+    Returns one result dict per stage.
+    """
+    tpl_path = os.path.join(workdir, "bench.tpl")
+    with open(tpl_path, "wb") as f:
+        f.write(synthetic_tpl([(format, width, height)]))
+    with open(tpl_path, "rb") as f:
+        buffer = imageStream.map_tpl(f)
+
+    format_name = imageStream.FORMAT_MAP[format]
+    png_path = os.path.join(workdir, "bench.png")
+
+    parse_time = best_time(lambda: imageStream.parse_tpl(buffer), repeat)
+    header = imageStream.parse_tpl(buffer)[0]
+
+    def extract():
+        return imageStream.get_image_data(buffer, header), imageStream.get_palette_data(buffer, header)
+    extract_time = best_time(extract, repeat)
+
+    image_data, palette_data = extract()
+    palette = (palette_data, header.palette_format) if palette_data is not None else None
+    # Only the first call pays for JIT compilation (or loading it from disk), and only the fastest run counts
+    decode_time = best_time(lambda: decode.decode_image(image_data, height, width, format_name, palette, backend), repeat)
+
+    image = decode.decode_image(image_data, height, width, format_name, palette, backend)
+    save_time = best_time(lambda: decode.save_as_png(image, png_path), repeat)
+
+    del image_data, palette_data, palette
+    raw_bytes = header.data_size
+    pixels = width * height
+    results = []
+    for stage, seconds in zip(STAGES, (parse_time, extract_time, decode_time, save_time)):
+        seconds = max(seconds, 1e-9)
+        results.append({
+            "format": format_name,
+            "width": width,
+            "height": height,
+            "stage": stage,
+            "seconds": seconds,
+            "mpix_s": pixels / 1e6 / seconds,
+            "mb_s": raw_bytes / 1e6 / seconds,
+        })
+    return results
+
+def run_benchmark(formats, sizes, repeat=5, backend=None):
+    """
+    Benchmark every format at every size. Returns the JSON-ready report.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for format in formats:
+            for width, height in sizes:
+                results.extend(bench_case(format, width, height, workdir, repeat, backend))
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "backend": backend or decode.DEFAULT_BACKEND,
+        },
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(report, baseline, tolerance):
+    """
+    Compare throughput against a baseline report. Returns the list of
+    regressions: cases whose MPix/s dropped by more than `tolerance`
+    (a fraction, e.g. 0.2 = 20% slower). Cases that took less than
+    MIN_COMPARE_SECONDS in the baseline are skipped.
+    """
+    key = lambda r: (r["format"], r["width"], r["height"], r["stage"])
+    previous = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(key(result))
+        if before is None or before["seconds"] < MIN_COMPARE_SECONDS:
+            continue
+        ratio = result["mpix_s"] / before["mpix_s"]
+        if ratio < 1 - tolerance:
+            regressions.append(dict(result, baseline_mpix_s=before["mpix_s"], ratio=ratio))
+    return regressions
+
+def print_table(report):
+    print(f"{'format':<8}{'size':>11}{'stage':>9}{'ms':>10}{'MPix/s':>10}{'MB/s':>10}")
+    for r in report["results"]:
+        size = f"{r['width']}x{r['height']}"
+        print(f"{r['format']:<8}{size:>11}{r['stage']:>9}{r['seconds'] * 1000:>10.3f}{r['mpix_s']:>10.1f}{r['mb_s']:>10.1f}")
+
+# Script execution with argparse
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark TPL parsing, extraction, decoding and PNG saving on synthetic textures.")
+    parser.add_argument("--formats", type=str, default=None, help="Comma separated format names (default: every format in FORMAT_MAP).")
+    parser.add_argument("--sizes", type=str, default=None, help="Comma separated WxH sizes (default: 8x8 through 1024x1024).")
+    parser.add_argument("--quick", action="store_true", help="Only small sizes, for a fast smoke run.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per stage; the fastest is reported.")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the JSON report here (default: stdout).")
+    parser.add_argument("--backend", type=str, default=None, choices=imageStream.BACKENDS,
+                        help=f"Decoder implementation to time (default: {decode.DEFAULT_BACKEND}).")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Time every decoder implementation of each format at each size instead, and store the fastest "
+                             f"for this machine's automatic dispatch (in {decoderCalibration.DEFAULT_CALIBRATION}).")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs. the baseline before failing (fraction).")
+    args = parser.parse_args()
+
+    if args.formats:
+        try:
+            formats = [imageStream.FORMAT_IDS[name] for name in args.formats.split(",")]
+        except KeyError as e:
+            print(f"Error: Unknown format {e}.")
+            sys.exit(1)
+    else:
+        formats = list(imageStream.FORMAT_MAP)
+
+    if args.sizes:
+        sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes.split(",")]
+    else:
+        sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+
+    if args.calibrate:
+        calibration = decoderCalibration.calibrate([imageStream.FORMAT_MAP[format] for format in formats],
+                                                   sizes if args.sizes or args.quick else decoderCalibration.CALIBRATION_SIZES)
+        print(f"{'format':<8}{'size':>11}  fastest")
+        for format_name, entries in calibration.items():
+            for entry in entries:
+                size = f"{entry['width']}x{entry['height']}"
+                print(f"{format_name:<8}{size:>11}  {entry['fastest']}")
+        sys.exit(0)
+
+    report = run_benchmark(formats, sizes, args.repeat, args.backend)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print_table(report)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION: {r['format']} {r['width']}x{r['height']} {r['stage']}: "
+                  f"{r['mpix_s']:.1f} MPix/s vs {r['baseline_mpix_s']:.1f} baseline ({r['ratio']:.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,76 @@
+import os
+import json
+import numpy as np
+
+# Each image starts on a 64-byte boundary in the blob
+BUNDLE_ALIGN = 64
+BUNDLE_VERSION = 1
+
+# Sampler parameters copied from the image header into the index
+SAMPLER_FIELDS = ("wrap_s", "wrap_t", "min_filter", "mag_filter", "lod_bias", "edge_lod_enable", "min_lod", "max_lod")
+
+def index_path(blob_path):
+    return os.path.splitext(blob_path)[0] + ".json"
+
+def layout(shapes):
+    """
+    Assign blob offsets to (H,W,4) uint8 images. Returns (offsets, total size).
+    """
+    offsets = []
+    offset = 0
+    for height, width, channels in shapes:
+        offsets.append(offset)
+        offset += height * width * channels
+        offset = (offset + BUNDLE_ALIGN - 1) // BUNDLE_ALIGN * BUNDLE_ALIGN
+    return offsets, offset
+
+def create_blob(blob_path, size):
+    """
+    Create (or truncate) the blob at its final size so workers can fill in
+    their images at fixed offsets in any order.
+    """
+    os.makedirs(os.path.dirname(blob_path) or ".", exist_ok=True)
+    with open(blob_path, "wb") as f:
+        f.truncate(size)
+
+def write_image(blob_path, offset, image):
+    """
+    Write one decoded (H,W,4) image into its slot of the blob.
+    """
+    with open(blob_path, "r+b") as f:
+        f.seek(offset)
+        f.write(np.ascontiguousarray(image).data)
+
+def write_index(blob_path, entries):
+    """
+    Write the index next to the blob. Each entry holds name, offset, shape,
+    format and the sampler parameters of the image header.
+    """
+    index = {
+        "version": BUNDLE_VERSION,
+        "blob": os.path.basename(blob_path),
+        "images": entries,
+    }
+    with open(index_path(blob_path), "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+def open_bundle(path):
+    """
+    Open a bundle (blob or index path) with a single read-only mmap.
+    Returns ({name: (H,W,4) uint8 array view}, {name: index entry}).
+    """
+    with open(index_path(path)) as f:
+        index = json.load(f)
+    blob_path = os.path.join(os.path.dirname(index_path(path)), index["blob"])
+
+    images = {}
+    entries = {}
+    if not index["images"]:
+        return images, entries
+    blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+    for entry in index["images"]:
+        height, width, channels = entry["shape"]
+        size = height * width * channels
+        images[entry["name"]] = blob[entry["offset"]:entry["offset"] + size].reshape(height, width, channels)
+        entries[entry["name"]] = entry
+    return images, entries
@@ -0,0 +1,116 @@
+import numpy as np
+
+# Precomputed color-conversion tables shared by every decoder and palette
+# path. Each table maps a raw texel value straight to RGBA, so converting an
+# image is a single gather instead of shifts, masks and divisions per pixel.
+# Tables are built on first use and kept for the life of the process:
+#   rgb565_table(), rgb5a3_table(), ia8_table()  65536 x RGBA (uint16 values)
+#   ia4_table(), i8_table()                      256 x RGBA (one byte per texel)
+#   i4_pair_table()                              256 x 2 x RGBA (two texels per byte)
+
+_tables = {}
+
+def _cached(build):
+    def table():
+        if build.__name__ not in _tables:
+            built = np.ascontiguousarray(build(), dtype=np.uint8)
+            built.flags.writeable = False
+            _tables[build.__name__] = built
+        return _tables[build.__name__]
+    table.__name__ = build.__name__
+    table.__doc__ = build.__doc__
+    return table
+
+def to_rgba(r, g, b, a):
+    """
+    Pack per-channel arrays (or scalars) into a (...,4) uint8 RGBA array.
+    """
+    shape = np.broadcast(r, g, b, a).shape
+    rgba = np.empty(shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = r
+    rgba[..., 1] = g
+    rgba[..., 2] = b
+    rgba[..., 3] = a
+    return rgba
+
+@_cached
+def rgb565_table():
+    """
+    RGBA for every RGB565 value; 5/6-bit channels scale by (v*255)//31 and (v*255)//63.
+    """
+    val = np.arange(0x10000, dtype=np.uint32)
+    R = ((val >> 11) & 0x1F) * 255 // 31
+    G = ((val >> 5)  & 0x3F) * 255 // 63
+    B = ( val        & 0x1F) * 255 // 31
+    return to_rgba(R, G, B, 255)
+
+@_cached
+def rgb5a3_table():
+    """
+    RGBA for every RGB5A3 value: RGB555 if the top bit is set, ARGB with
+    4-bit channels otherwise.
+    """
+    val = np.arange(0x10000, dtype=np.uint32)
+    opaque = (val & 0x8000) != 0
+
+    # Decode both layouts for every value, then pick by the top bit
+    R = np.where(opaque, ((val >> 10) & 0x1F) * 255 // 31, ((val >> 8) & 0xF) * 17)
+    G = np.where(opaque, ((val >> 5)  & 0x1F) * 255 // 31, ((val >> 4) & 0xF) * 17)
+    B = np.where(opaque, ( val        & 0x1F) * 255 // 31, ( val       & 0xF) * 17)
+    A = np.where(opaque, 255, ((val >> 12) & 0xF) * 17)
+    return to_rgba(R, G, B, A)
+
+@_cached
+def ia8_table():
+    """
+    RGBA for every IA8 value: top byte = alpha, low byte = intensity.
+    """
+    val = np.arange(0x10000, dtype=np.uint32)
+    I = val & 0xFF
+    return to_rgba(I, I, I, val >> 8)
+
+@_cached
+def ia4_table():
+    """
+    RGBA for every IA4 byte: high nibble = alpha, low nibble = intensity, each scaled by 17.
+    """
+    val = np.arange(0x100, dtype=np.uint32)
+    I = (val & 0xF) * 17
+    return to_rgba(I, I, I, (val >> 4) * 17)
+
+@_cached
+def i8_table():
+    """
+    Opaque grey RGBA for every I8 byte.
+    """
+    I = np.arange(0x100, dtype=np.uint32)
+    return to_rgba(I, I, I, 255)
+
+@_cached
+def i4_pair_table():
+    """
+    The two opaque grey RGBA texels of every I4 byte, high nibble first,
+    each nibble scaled by 17.
+    """
+    val = np.arange(0x100, dtype=np.uint32)
+    I = np.stack((val >> 4, val & 0xF), axis=-1) * 17
+    return to_rgba(I, I, I, 255)
+
+# Texels gathered per np.take call; keeps its temporary intp index array in cache
+LOOKUP_CHUNK = 65536
+
+def lookup(table, values):
+    """
+    Gather table[values] as a (...,4) (or (...,2,4) for pair tables) uint8
+    array, moving each table entry as a single 4 (or 8) byte word.
+    """
+    texel_shape = table.shape[1:]
+    word = {4: np.uint32, 8: np.uint64}[table[0].nbytes]
+    words = table.reshape(len(table), -1).view(word)[:, 0]
+
+    # np.take is markedly faster than fancy indexing here, more so in cache-sized chunks
+    flat = np.ravel(values)
+    gathered = np.empty(flat.size, dtype=word)
+    for start in range(0, flat.size, LOOKUP_CHUNK):
+        np.take(words, flat[start:start + LOOKUP_CHUNK], out=gathered[start:start + LOOKUP_CHUNK])
+    return gathered.view(np.uint8).reshape(np.shape(values) + texel_shape)
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+import numpy as np
+
+import imageStream
+
+# Contact sheet of every texture under a directory (or glob): one cell per
+# image, built from decode.decode_preview's quarter-scale previews instead
+# of full decodes. Cells are filled in file order, a row at a time, and each
+# finished row is streamed into the PNG, so memory stays at one row of
+# cells however many textures there are. A JSON legend next to the sheet
+# maps every cell back to its TPL and image.
+#   python contactSheet.py a -o sheet.png
+#   python contactSheet.py "**/*.tpl" -o sheet.png --cell 96 --columns 20
+
+DEFAULT_CELL = 64
+DEFAULT_COLUMNS = 32
+
+def fit_to_cell(image, cell):
+    """
+    Place an RGBA image in the middle of a transparent cell x cell square,
+    shrinking it (keeping its aspect ratio) if it doesn't fit.
+    """
+    from PIL import Image
+
+    out = np.zeros((cell, cell, 4), dtype=np.uint8)
+    if image.shape[0] > cell or image.shape[1] > cell:
+        thumb = Image.fromarray(image, mode="RGBA")
+        thumb.thumbnail((cell, cell), Image.BOX)
+        image = np.asarray(thumb)
+    height, width = image.shape[:2]
+    y, x = (cell - height) // 2, (cell - width) // 2
+    out[y:y + height, x:x + width] = image
+    return out
+
+def file_cells(tpl_file, cell=DEFAULT_CELL, backend=None):
+    """
+    Preview every image of one TPL into a cell. Returns a list of
+    (legend entry, cell array); images that can't be decoded get an empty
+    cell and an "error" in their entry.
+    """
+    import decode
+
+    with open(tpl_file, "rb") as file:
+        buffer = imageStream.map_tpl(file)
+    cells = []
+    for img_idx, image in enumerate(imageStream.parse_tpl(buffer)):
+        entry = {"tpl": tpl_file, "image": img_idx + 1, "format": image.format_name,
+                 "width": image.width, "height": image.height}
+        palette = None
+        if image.palette_addr is not None:
+            palette = (imageStream.get_palette_data(buffer, image), image.palette_format)
+        try:
+            preview = decode.decode_preview(imageStream.get_image_data(buffer, image), image.height, image.width,
+                                            image.format_name, palette, backend)
+            cells.append((entry, fit_to_cell(preview, cell)))
+        except (ValueError, NotImplementedError) as e:
+            entry["error"] = str(e)
+            cells.append((entry, np.zeros((cell, cell, 4), dtype=np.uint8)))
+    return cells
+
+def _file_cells(args):
+    # Pool worker
+    return file_cells(*args)
+
+def count_images(tpl_files):
+    """
+    Number of images per TPL file from its headers alone, leaving out files
+    that can't be parsed (with a message).
+    """
+    counts = {}
+    for tpl_file in tpl_files:
+        try:
+            with open(tpl_file, "rb") as file:
+                buffer = imageStream.map_tpl(file)
+            try:
+                counts[tpl_file] = len(imageStream.parse_tpl(buffer))
+            finally:
+                buffer.close()
+        except (ValueError, OSError) as e:
+            print(f"Skipping {tpl_file}: {e}")
+    return counts
+
+def contact_sheet(tpl_files, out_name, cell=DEFAULT_CELL, columns=DEFAULT_COLUMNS, jobs=None, backend=None):
+    """
+    Write a contact sheet PNG of every image in tpl_files to out_name, plus
+    its legend (out_name with a .json extension: sheet size and one entry
+    per cell, with its column and row). Returns the legend.
+    """
+    import pngWriter
+
+    counts = count_images(tpl_files)
+    tpl_files = [tpl_file for tpl_file in tpl_files if counts.get(tpl_file)]
+    n_images = sum(counts[tpl_file] for tpl_file in tpl_files)
+    columns = max(1, min(columns, n_images))
+    rows = max(1, (n_images + columns - 1) // columns)
+
+    jobs = jobs or os.cpu_count() or 1
+    work = [(tpl_file, cell, backend) for tpl_file in tpl_files]
+    pool = None
+    if jobs > 1 and len(work) > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(work)))
+        results = pool.map(_file_cells, work, chunksize=max(1, len(work) // (jobs * 8)))
+    else:
+        results = map(_file_cells, work)
+
+    entries = []
+    strip = np.zeros((cell, columns * cell, 4), dtype=np.uint8)
+    try:
+        with pngWriter.PNGWriter(out_name, columns * cell, rows * cell) as png:
+            for tpl_cells in results:
+                # A file whose image count changed since it was counted is cut to fit
+                for entry, image in tpl_cells[:n_images - len(entries)]:
+                    column = len(entries) % columns
+                    entry["column"], entry["row"] = column, len(entries) // columns
+                    entries.append(entry)
+                    strip[:, column * cell:(column + 1) * cell] = image
+                    if column == columns - 1:
+                        png.write_rows(strip)
+                        strip[:] = 0
+            # Short last row, and blank rows for images that went missing
+            while png.rows_written < rows * cell:
+                png.write_rows(strip)
+                strip[:] = 0
+    finally:
+        if pool:
+            pool.shutdown()
+
+    legend = {"cell": cell, "columns": columns, "rows": rows, "images": entries}
+    with open(os.path.splitext(out_name)[0] + ".json", "w") as f:
+        json.dump(legend, f, indent=1)
+    return legend
+
+if __name__ == "__main__":
+    # Pillow is checked (and installed if missing) before decode imports it
+    imageStream.ensure_pillow()
+    import decode
+
+    parser = argparse.ArgumentParser(description="Build a contact sheet PNG of every texture in TPL files from fast quarter-scale previews.")
+    parser.add_argument("path", type=str, help="The TPL file, directory or glob to include.")
+    parser.add_argument("--output", "-o", type=str, default="sheet.png", help="The sheet PNG; its legend is written next to it as .json (default: sheet.png).")
+    parser.add_argument("--cell", type=int, default=DEFAULT_CELL, metavar="PX", help=f"Cell size; larger previews are shrunk to fit (default: {DEFAULT_CELL}).")
+    parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS, help=f"Cells per row (default: {DEFAULT_COLUMNS}).")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of worker processes (default: number of cores).")
+    parser.add_argument("--backend", type=str, default=None, choices=imageStream.BACKENDS,
+                        help=f"Preview implementation (default: {decode.DEFAULT_BACKEND}).")
+    args = parser.parse_args()
+
+    if imageStream.is_batch_path(args.path):
+        tpl_files, _ = imageStream.find_tpl_files(args.path)
+    elif os.path.exists(args.path):
+        tpl_files = [args.path]
+    else:
+        print(f"Error: The file {args.path} does not exist.")
+        sys.exit(1)
+    if not tpl_files:
+        print(f"No TPL files found in {args.path}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    legend = contact_sheet(tpl_files, args.output, args.cell, args.columns, args.jobs, args.backend)
+    failed = sum(1 for entry in legend["images"] if "error" in entry)
+    print(f"Contact sheet of {len(legend['images'])} images ({failed} failed) from {len(tpl_files)} files "
+          f"in {time.perf_counter() - start:.2f}s: {args.output}")
@@ -0,0 +1,100 @@
+import struct
+import numpy as np
+
+# DDS header flags (see the DDS_HEADER / DDS_PIXELFORMAT docs)
+DDSD_CAPS = 0x1
+DDSD_HEIGHT = 0x2
+DDSD_WIDTH = 0x4
+DDSD_PIXELFORMAT = 0x1000
+DDSD_MIPMAPCOUNT = 0x20000
+DDSD_LINEARSIZE = 0x80000
+DDPF_FOURCC = 0x4
+DDSCAPS_COMPLEX = 0x8
+DDSCAPS_TEXTURE = 0x1000
+DDSCAPS_MIPMAP = 0x400000
+
+# GC stores the 2-bit indices of a row with the first texel in the top bits,
+# BC1 with the first texel in the bottom bits => reverse the 4 pairs of each byte
+_INDEX_SWAP = np.array([((i & 0x03) << 6) | ((i & 0x0C) << 2) | ((i & 0x30) >> 2) | ((i & 0xC0) >> 6)
+                        for i in range(256)], dtype=np.uint8)
+
+def cmpr_size(width, height):
+    """
+    Bytes of one CMPR level: 32 bytes per (partial) 8x8 macro-block.
+    """
+    return ((width + 7) // 8) * ((height + 7) // 8) * 32
+
+def cmpr_to_bc1(image_data, width, height):
+    """
+    Rewrite one CMPR level as BC1 (DXT1) blocks using byte shuffles only:
+      - c0/c1 become little-endian
+      - the 2-bit indices of each row are mirrored
+      - 4x4 blocks go from 2x2 groups per 8x8 macro-block to plain row order,
+        dropping the sub-blocks that lie entirely outside width/height
+    """
+    blocks_wide = (width  + 7) // 8
+    blocks_high = (height + 7) // 8
+    n_blocks = blocks_wide * blocks_high * 4
+    if len(image_data) < n_blocks * 8:
+        raise ValueError("File too small for CMPR tiled data")
+    blocks = np.frombuffer(image_data, dtype=np.uint8, count=n_blocks * 8).reshape(n_blocks, 8)
+
+    bc1 = np.empty_like(blocks)
+    bc1[:, 0] = blocks[:, 1]
+    bc1[:, 1] = blocks[:, 0]
+    bc1[:, 2] = blocks[:, 3]
+    bc1[:, 3] = blocks[:, 2]
+    bc1[:, 4:8] = _INDEX_SWAP[blocks[:, 4:8]]
+
+    # (by, bx, sub_y, sub_x) => (by, sub_y, bx, sub_x) => rows of 4x4 blocks
+    bc1 = bc1.reshape(blocks_high, blocks_wide, 2, 2, 8).transpose(0, 2, 1, 3, 4)
+    bc1 = bc1.reshape(blocks_high * 2, blocks_wide * 2, 8)
+    return bc1[:(height + 3) // 4, :(width + 3) // 4].tobytes()
+
+def cmpr_levels(image_data, width, height):
+    """
+    Split a CMPR mip chain into (width, height, bytes) per level, for as many
+    levels as image_data holds.
+    """
+    levels = []
+    offset = 0
+    while True:
+        size = cmpr_size(width, height)
+        if offset + size > len(image_data):
+            break
+        levels.append((width, height, image_data[offset:offset + size]))
+        offset += size
+        if width == 1 and height == 1:
+            break
+        width, height = max(1, width // 2), max(1, height // 2)
+    return levels
+
+def dds_header(width, height, n_levels):
+    """
+    128-byte "DDS " magic + DDS_HEADER for a DXT1 texture.
+    """
+    flags = DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT | DDSD_LINEARSIZE
+    caps = DDSCAPS_TEXTURE
+    if n_levels > 1:
+        flags |= DDSD_MIPMAPCOUNT
+        caps |= DDSCAPS_COMPLEX | DDSCAPS_MIPMAP
+    linear_size = max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * 8
+
+    header = struct.pack("<4sIIIIIII", b"DDS ", 124, flags, height, width, linear_size, 0, n_levels)
+    header += bytes(4 * 11)  # dwReserved1
+    header += struct.pack("<II4sIIIII", 32, DDPF_FOURCC, b"DXT1", 0, 0, 0, 0, 0)
+    header += struct.pack("<IIIII", caps, 0, 0, 0, 0)
+    return header
+
+def save_cmpr_as_dds(image_data, width, height, out_name):
+    """
+    Write a CMPR image (and any mip levels following it in image_data) as a
+    BC1 DDS file without decoding it.
+    """
+    levels = cmpr_levels(image_data, width, height)
+    if not levels:
+        raise ValueError("File too small for CMPR tiled data")
+    with open(out_name, "wb") as f:
+        f.write(dds_header(width, height, len(levels)))
+        for level_width, level_height, level_data in levels:
+            f.write(cmpr_to_bc1(level_data, level_width, level_height))
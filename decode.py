@@ -1,11 +1,25 @@
 import os
 import sys
+import time
+import argparse
+import functools
+import itertools
+import collections
+import concurrent.futures
 import numpy as np
 from PIL import Image
 
-# Global list to store image data as dictionaries
-image_data_list = []
-filesToDelete = []
+import imageStream
+import decodeCache
+import dds
+import bundle
+import colorTables
+import profiler
+import pngWriter
+import extractManifest
+import savePipeline
+import numbaDecode
+import decoderCalibration
 
 # Format mappings
 FORMATS = {
@@ -22,135 +36,157 @@ FORMATS = {
     'CMPR': 'CMPR',
 }
 
+# colorTables table the texel values of each direct-color format are looked
+# up in (I4's once expanded to 8 bits); palette entries use the same ones
+TEXEL_TABLES = {
+    'I4': colorTables.i8_table,
+    'I8': colorTables.i8_table,
+    'IA4': colorTables.ia4_table,
+    'IA8': colorTables.ia8_table,
+    'RGB565': colorTables.rgb565_table,
+    'RGB5A3': colorTables.rgb5a3_table,
+}
+
 # -----------------------------------------------------------------------------
 #                           HELPER FUNCTIONS
 # -----------------------------------------------------------------------------
 
-def save_as_png(image_data, out_name):
+def png_settings(options):
+    """
+    The compress_level/optimize arguments for the PNG savers from options
+    (png_compress_level, png_optimize).
+    """
+    options = options or {}
+    return {"compress_level": options.get("png_compress_level", savePipeline.PNG_COMPRESS_LEVEL),
+            "optimize": bool(options.get("png_optimize"))}
+
+def save_as_png(image_data, out_name, compress_level=savePipeline.PNG_COMPRESS_LEVEL, optimize=False):
     """
     Save a (H,W,4) RGBA NumPy array as a PNG using Pillow.
     """
     pil_img = Image.fromarray(image_data, mode='RGBA')
-    pil_img.save(out_name)
+    pil_img.save(out_name, compress_level=compress_level, optimize=optimize)
 
-def decode_and_save(image, filename, height, width):
+def save_as_paletted_png(indices, palette, out_name, compress_level=savePipeline.PNG_COMPRESS_LEVEL, optimize=False):
     """
-    Place common logic for saving the image as PNG.
+    Save (H,W) palette indices plus an (N<=256,4) RGBA palette as a native
+    "P" PNG; palette alpha is written as a tRNS chunk.
     """
-    output_dir = "tex"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    output_filename = f"{os.path.basename(filename).split('_')[0]}.png"
-    output_filepath = os.path.join(output_dir, output_filename)
-    save_as_png(image, output_filepath)
+    pil_img = Image.fromarray(indices.astype(np.uint8))
+    pil_img.putpalette(palette.tobytes(), rawmode='RGBA')
+    pil_img.save(out_name, compress_level=compress_level, optimize=optimize)
+
+def output_path(img_index, output_dir="tex", level=0, ext=".png"):
+    if level:
+        return os.path.join(output_dir, f"i-{img_index}_mip{level}{ext}")
+    return os.path.join(output_dir, f"i-{img_index}{ext}")
+
+def output_kind(format_str, palette=None, options=None):
+    """
+    (variant, extension) of an image's output file: variant tells apart the
+    encodings of the same pixels for the cache and manifests, "P" for
+    paletted PNGs (--png-palette), "DDS" for BC1 files (--dds), else "".
+    PNGs written with other than the default encoder settings (see
+    extractManifest.encoding_signature) get them appended after a "+",
+    e.g. "+z9o" for level 9 optimized, "P+z0".
+    """
+    options = options or {}
+    if options.get("dds") and format_str == 'CMPR':
+        return "DDS", ".dds"
+    paletted = options.get("png_palette") and palette and format_str in imageStream.PALETTED_FORMATS
+    variant = "P" if paletted else ""
+    encoding = extractManifest.encoding_signature(options)
+    # Paletted PNGs are always written by Pillow
+    encoding["stream"] = encoding["stream"] and not paletted
+    if encoding != extractManifest.encoding_signature(None):
+        variant += (f"+z{encoding['png_compress_level']}" + ("o" if encoding["png_optimize"] else "")
+                    + ("s" if encoding["stream"] else ""))
+    return variant, ".png"
+
+def decode_and_save(image, img_index, output_dir="tex", palette=None, level=0,
+                    compress_level=savePipeline.PNG_COMPRESS_LEVEL, optimize=False):
+    """
+    Place common logic for saving the image as PNG (tex/i-<index>.png, or
+    tex/i-<index>_mip<level>.png for mip levels).
+    With a palette, image holds palette indices and is saved as a "P" PNG.
+    Returns the path written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_filepath = output_path(img_index, output_dir, level)
+    if palette is not None:
+        save_as_paletted_png(image, palette, output_filepath, compress_level, optimize)
+    else:
+        save_as_png(image, output_filepath, compress_level, optimize)
+    return output_filepath
+
+# Convert an array of 16-bit RGB565 colors to (...,3) RGB channels
+def rgb565_to_rgb(value):
+    value = np.asarray(value, dtype=np.uint16)
+    return colorTables.rgb565_table()[value, :3].astype(np.uint16)
 
-# Convert a 16-bit RGB565 color to (R,G,B) or (R,G,B,A)
-def rgb565_to_rgba(value):
-    r = (value >> 11) & 0x1F  # 5 bits
-    g = (value >> 5 ) & 0x3F  # 6 bits
-    b =  value        & 0x1F  # 5 bits
+# -----------------------------------------------------------------------------
+#                           TILE DESWIZZLING
+# -----------------------------------------------------------------------------
 
-    # Scale to 0–255 with integer rounding
-    R = (r * 255) // 31
-    G = (g * 255) // 63
-    B = (b * 255) // 31
+def read_tiles(raw_data, height, width, tile_w, tile_h, bits_per_pixel, format_name):
+    """
+    View the tiled part of raw_data as a flat uint8 array, after checking
+    that there is enough data for every (partial) tile of the image.
+    """
+    tiles_x = (width  + tile_w - 1) // tile_w
+    tiles_y = (height + tile_h - 1) // tile_h
+    expected_size = tiles_x * tiles_y * tile_w * tile_h * bits_per_pixel // 8
+    if len(raw_data) < expected_size:
+        raise ValueError(f"File too small for {format_name} tiled data")
+    return np.frombuffer(raw_data, dtype=np.uint8, count=expected_size)
 
-    return (R, G, B, 255)
+def deswizzle(pixels, height, width, tile_w, tile_h):
+    """
+    Reorder pixels stored tile by tile into a linear (H,W,...) image.
+    pixels is indexed by pixel in file order on its first axis; any
+    trailing axes (e.g. bytes of a pixel) are carried along untouched.
+    The tiles are viewed as (tiles_y, tiles_x, tile_h, tile_w, ...),
+    transposed into row order and cropped to width/height.
+    """
+    tiles_x = (width  + tile_w - 1) // tile_w
+    tiles_y = (height + tile_h - 1) // tile_h
+    tail = pixels.shape[1:]
+    tiles = pixels.reshape((tiles_y, tiles_x, tile_h, tile_w) + tail)
+    linear = tiles.swapaxes(1, 2).reshape((tiles_y * tile_h, tiles_x * tile_w) + tail)
+    return linear[:height, :width]
 
 # ================================ I4 DECOMPRESSION ============================
-def decode_I4(file, height, width):
+def decode_I4(image_data, height, width):
     """
     I4 => 4 bits/pixel, stored in 8×8 tiles => 32 bytes per tile.
     top nibble = first pixel, bottom nibble = second pixel
     Expand nibble (0..15) -> intensity (0..255) by multiplying by 17
     """
-    raw_data = file.read()
-    tile_w = 8
-    tile_h = 8
-    bytes_per_tile = 32  # 8×8 => 64 px => 64 * 4 bits => 32 bytes
+    raw = read_tiles(image_data, height, width, 8, 8, 4, "I4")
 
-    tiles_x = (width  + tile_w - 1) // tile_w
-    tiles_y = (height + tile_h - 1) // tile_h
-    expected_size = tiles_x * tiles_y * bytes_per_tile
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for I4 tiled data")
-
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-
-    offset = 0
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            # read 1 tile (8×8=64 px => 32 bytes)
-            tile_data = raw_data[offset : offset + bytes_per_tile]
-            offset += bytes_per_tile
-
-            # unscramble within the tile
-            pixel_i = 0
-            for row in range(tile_h):
-                iy = ty * tile_h + row
-                if iy >= height:
-                    break
-                for col in range(tile_w):
-                    ix = tx * tile_w + col
-                    if ix >= width:
-                        break
-
-                    # each byte has 2 pixels
-                    # so pixel_i // 2 => which byte
-                    # shift => high nibble or low nibble
-                    byte_i = pixel_i // 2
-                    shift = 4 if (pixel_i & 1) == 0 else 0
-                    val   = (tile_data[byte_i] >> shift) & 0xF
-                    pixel_i += 1
-                    I = val * 17
-                    image[iy, ix] = (I, I, I, 255)
-
-    # Save
-    decode_and_save(image, file.name, height, width)
+    # each byte holds 2 horizontally adjacent pixels => deswizzle bytes as
+    # 4x8 tiles of a half-width image, then expand every byte into its pair
+    pairs = deswizzle(raw, height, (width + 1) // 2, 4, 8)
+    image = colorTables.lookup(colorTables.i4_pair_table(), pairs)
+    image = image.reshape(height, -1, 4)[:, :width]
+
+    return np.ascontiguousarray(image)
 
 # ================================ I8 DECOMPRESSION ============================
-def decode_I8(file, height, width):
+def decode_I8(image_data, height, width):
     """
     I8 => 8 bits/pixel, stored in 8×4 tiles => 8*4=32 px => 32 bytes/tile
     """
-    raw_data = file.read()
+    raw = read_tiles(image_data, height, width, 8, 4, 8, "I8")
 
-    tile_w = 8
-    tile_h = 4
-    bytes_per_tile = tile_w * tile_h  # = 32
+    # I => grayscale
+    I = deswizzle(raw, height, width, 8, 4)
+    image = colorTables.lookup(colorTables.i8_table(), I)
 
-    tiles_x = (width  + tile_w - 1) // tile_w
-    tiles_y = (height + tile_h - 1) // tile_h
-    expected_size = tiles_x * tiles_y * bytes_per_tile
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for I8 tiled data")
-
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-    offset = 0
-
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            tile_data = raw_data[offset : offset+bytes_per_tile]
-            offset += bytes_per_tile
-
-            pixel_i = 0
-            for row in range(tile_h):
-                iy = ty*tile_h + row
-                if iy >= height:
-                    break
-                for col in range(tile_w):
-                    ix = tx*tile_w + col
-                    if ix >= width:
-                        break
-                    val = tile_data[pixel_i]
-                    pixel_i += 1
-                    # I => grayscale
-                    image[iy, ix] = (val, val, val, 255)
-
-    decode_and_save(image, file.name, height, width)
+    return image
 
 # ================================ IA4 DECOMPRESSION ===========================
-def decode_IA4(file, height, width):
+def decode_IA4(image_data, height, width):
     """
     Decode IA4 data stored in 8×4 tiles (typical GC/Wii layout).
     Each tile is 8 pixels wide, 4 pixels tall => 32 pixels => 32 bytes.
@@ -159,109 +195,28 @@ def decode_IA4(file, height, width):
       - High nibble = alpha   (0..15 => scale by 17 => 0..255)
       - Low  nibble = intensity (0..15 => scale by 17 => 0..255)
     """
+    raw = read_tiles(image_data, height, width, 8, 4, 8, "IA4")
 
-    # Read all raw tile data
-    raw_data = file.read()
-
-    # We'll store the final image as RGBA
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-
-    # Compute how many tiles horizontally and vertically
-    tile_w = 8
-    tile_h = 4
-    tiles_x = (width  + tile_w - 1) // tile_w   # round up if needed
-    tiles_y = (height + tile_h - 1) // tile_h
-
-    # Each tile is 8×4 => 32 bytes for IA4
-    tile_size = tile_w * tile_h
-    expected_size = tiles_x * tiles_y * tile_size
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for IA4 tiled data")
-
-    offset = 0
-
-    # Loop over each tile in “reading order”
-    # tile_y => row of tiles, tile_x => column of tiles
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            # Process one 8×4 tile => 32 bytes
-            tile_data = raw_data[offset : offset + tile_size]
-            offset += tile_size
-
-            # Write these 8×4 pixels into the final image
-            # in row-major order *within* the tile
-            pixel_i = 0
-            for row in range(tile_h):
-                # actual y in the final image
-                iy = ty * tile_h + row
-                if iy >= height:
-                    break  # skip if tile goes beyond image
+    val = deswizzle(raw, height, width, 8, 4)
+    image = colorTables.lookup(colorTables.ia4_table(), val)
 
-                for col in range(tile_w):
-                    ix = tx * tile_w + col
-                    if ix >= width:
-                        break
-
-                    val = tile_data[pixel_i]
-                    pixel_i += 1
-
-                    # top nibble => alpha
-                    a_nib  = (val >> 4) & 0xF  # 0..15
-                    # low nibble => intensity
-                    i_nib  = val & 0xF        # 0..15
-
-                    A = a_nib * 17
-                    I = i_nib * 17
-
-                    image[iy, ix] = (I, I, I, A)
-
-    decode_and_save(image, file.name, height, width)
+    return image
 
 # ================================ IA8 DECOMPRESSION ===========================
-def decode_IA8(file, height, width):
-    raw_data = file.read()
+def decode_IA8(image_data, height, width):
+    """
+    IA8 => 16 bits/pixel, stored in 4×4 tiles => 32 bytes/tile.
+    top byte = alpha, low byte = intensity
+    """
+    raw = read_tiles(image_data, height, width, 4, 4, 16, "IA8")
 
-    tile_w = 4
-    tile_h = 4
-    bpp = 2
-    tile_size = tile_w * tile_h * bpp  # 4×4×2=32
+    val = deswizzle(raw.view('>u2'), height, width, 4, 4)
+    image = colorTables.lookup(colorTables.ia8_table(), val)
 
-    tiles_x = (width  + tile_w - 1) // tile_w
-    tiles_y = (height + tile_h - 1) // tile_h
-    expected_size = tiles_x * tiles_y * tile_size
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for IA8 tiled data")
-
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-    offset = 0
-
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            tile_data = raw_data[offset:offset+tile_size]
-            offset += tile_size
-            idx = 0
-            for row in range(tile_h):
-                iy = ty*tile_h + row
-                if iy >= height:
-                    break
-                for col in range(tile_w):
-                    ix = tx*tile_w + col
-                    if ix >= width:
-                        break
-                    # read big-endian 16 bits
-                    hi = tile_data[idx]
-                    lo = tile_data[idx+1]
-                    idx += 2
-                    val = (hi << 8) | lo
-                    # top byte = alpha, low byte = intensity
-                    A = (val >> 8) & 0xFF
-                    I = val & 0xFF
-                    image[iy, ix] = (I, I, I, A)
-
-    decode_and_save(image, file.name, height, width)
+    return image
 
 # ================================ RGB565 DECOMPRESSION ========================
-def decode_RGB565(file, height, width):
+def decode_RGB565(image_data, height, width):
     """
     RGB565 in 4×4 tiles => each tile = 16 pixels × 2 bytes = 32 bytes.
     Bits:
@@ -270,61 +225,16 @@ def decode_RGB565(file, height, width):
       bits 4..0   => B (0..31)
     We'll scale 5-bit channels up by (val*255)//31, 6-bit channel by (val*255)//63.
     """
+    raw = read_tiles(image_data, height, width, 4, 4, 16, "RGB565")
 
-    raw_data = file.read()
+    # 16 bits big-endian per pixel
+    val = deswizzle(raw.view('>u2'), height, width, 4, 4)
+    image = colorTables.lookup(colorTables.rgb565_table(), val)
 
-    # tile is 4x4 => 16 pixels
-    tile_w = 4
-    tile_h = 4
-    bytes_per_pixel = 2
-    tile_size = tile_w * tile_h * bytes_per_pixel  # 16 * 2 = 32
-
-    # how many tiles horizontally and vertically
-    tiles_x = (width  + tile_w - 1) // tile_w
-    tiles_y = (height + tile_h - 1) // tile_h
-    expected_size = tiles_x * tiles_y * tile_size
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for tiled RGB565 data")
-
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-
-    offset = 0
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            # read one 4x4 tile => 32 bytes
-            tile_data = raw_data[offset : offset + tile_size]
-            offset += tile_size
-
-            pixel_i = 0
-            for row in range(tile_h):
-                iy = ty*tile_h + row
-                if iy >= height:
-                    break
-                for col in range(tile_w):
-                    ix = tx*tile_w + col
-                    if ix >= width:
-                        break
-
-                    # read 16 bits big-endian
-                    hi = tile_data[pixel_i]
-                    lo = tile_data[pixel_i+1]
-                    pixel_i += 2
-                    val = (hi << 8) | lo
-
-                    r = (val >> 11) & 0x1F
-                    g = (val >> 5)  & 0x3F
-                    b =  val        & 0x1F
-
-                    R = (r * 255) // 31
-                    G = (g * 255) // 63
-                    B = (b * 255) // 31
-                    image[iy, ix] = (R, G, B, 255)
-
-    # Save result
-    decode_and_save(image, file.name, height, width)
+    return image
 
 # ================================ RGB5A3 DECOMPRESSION ========================
-def decode_RGB5A3(file, height, width):
+def decode_RGB5A3(image_data, height, width):
     """
     RGB5A3 in 4×4 tiles => each tile = 16 pixels × 2 bytes = 32 bytes.
     If top bit == 0 => ARGB4444:
@@ -338,253 +248,329 @@ def decode_RGB5A3(file, height, width):
        bits  0.. 4 => blue  (0..31)
        alpha = 255
     """
+    raw = read_tiles(image_data, height, width, 4, 4, 16, "RGB5A3")
 
-    raw_data = file.read()
+    # The per-pixel mode switch makes direct arithmetic slow, so every
+    # possible 16-bit value is decoded once (colorTables) and looked up
+    val = deswizzle(raw.view('>u2'), height, width, 4, 4)
+    image = colorTables.lookup(colorTables.rgb5a3_table(), val)
 
-    tile_w = 4
-    tile_h = 4
-    bytes_per_pixel = 2
-    tile_size = tile_w * tile_h * bytes_per_pixel  # 16 px => 32 bytes
-
-    tiles_x = (width  + tile_w - 1) // tile_w
-    tiles_y = (height + tile_h - 1) // tile_h
-    expected_size = tiles_x * tiles_y * tile_size
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for tiled RGB5A3 data")
-
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-
-    offset = 0
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            # read 32 bytes for the 4×4 tile
-            tile_data = raw_data[offset : offset + tile_size]
-            offset += tile_size
-
-            pixel_i = 0
-            for row in range(tile_h):
-                iy = ty * tile_h + row
-                if iy >= height:
-                    break
-                for col in range(tile_w):
-                    ix = tx * tile_w + col
-                    if ix >= width:
-                        break
-
-                    hi = tile_data[pixel_i]
-                    lo = tile_data[pixel_i+1]
-                    pixel_i += 2
-                    val = (hi << 8) | lo
-
-                    if (val & 0x8000) == 0:
-                        # ARGB4444
-                        a = (val >> 12) & 0xF
-                        r = (val >> 8)  & 0xF
-                        g = (val >> 4)  & 0xF
-                        b =  val        & 0xF
-                        A = a * 17
-                        R = r * 17
-                        G = g * 17
-                        B = b * 17
-                    else:
-                        # RGB555 => alpha=255
-                        r = (val >> 10) & 0x1F
-                        g = (val >> 5)  & 0x1F
-                        b =  val        & 0x1F
-                        A = 255
-                        R = (r * 255) // 31
-                        G = (g * 255) // 31
-                        B = (b * 255) // 31
-
-                    image[iy, ix] = (R, G, B, A)
-
-    decode_and_save(image, file.name, height, width)
+    return image
 
 # ================================ RGBA32 DECOMPRESSION ========================
-def decode_RGBA32(file, height, width):
+def decode_RGBA32(image_data, height, width):
     """
     RGBA32 => 4 bytes per pixel, stored in 4×4 tiles => 16 pixels => 64 bytes.
     We'll assume the layout is [R][G][B][A] in big-endian for each pixel.
     Some docs mention ARGB or other orders, so adjust as needed.
     """
+    raw = read_tiles(image_data, height, width, 4, 4, 32, "RGBA32")
 
-    raw_data = file.read()
+    # pixels are already RGBA, only the tile order needs undoing
+    image = np.ascontiguousarray(deswizzle(raw.reshape(-1, 4), height, width, 4, 4))
 
-    tile_w = 4
-    tile_h = 4
-    bytes_per_pixel = 4
-    tile_size = tile_w * tile_h * bytes_per_pixel  # 16 px => 64 bytes
+    return image
 
-    tiles_x = (width  + tile_w - 1) // tile_w
-    tiles_y = (height + tile_h - 1) // tile_h
-    expected_size = tiles_x * tiles_y * tile_size
-    if len(raw_data) < expected_size:
-        raise ValueError("File too small for tiled RGBA32 data")
-
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-
-    offset = 0
-    for ty in range(tiles_y):
-        for tx in range(tiles_x):
-            # read 64 bytes for one 4×4 tile
-            tile_data = raw_data[offset : offset + tile_size]
-            offset += tile_size
-
-            pixel_i = 0
-            for row in range(tile_h):
-                iy = ty*tile_h + row
-                if iy >= height:
-                    break
-                for col in range(tile_w):
-                    ix = tx*tile_w + col
-                    if ix >= width:
-                        break
-
-                    # read RGBA (4 bytes) in big-endian
-                    R = tile_data[pixel_i + 0]
-                    G = tile_data[pixel_i + 1]
-                    B = tile_data[pixel_i + 2]
-                    A = tile_data[pixel_i + 3]
-                    pixel_i += 4
-
-                    image[iy, ix] = (R, G, B, A)
-
-    decode_and_save(image, file.name, height, width)
+# ================================ PALETTES ====================================
+# Palette (TLUT) formats of C4/C8/C14X2 images
+PALETTE_FORMATS = ('IA8', 'RGB565', 'RGB5A3')
+
+def decode_palette(palette_data, palette_format):
+    """
+    Convert a palette's big-endian 16-bit entries into an (N,4) RGBA lookup
+    table, so indexed images decode with a single gather.
+    """
+    if palette_format not in PALETTE_FORMATS:
+        raise ValueError(f"Invalid palette format {palette_format}.")
+    entries = np.frombuffer(palette_data, dtype='>u2', count=len(palette_data) // 2)
+    return colorTables.lookup(TEXEL_TABLES[palette_format](), entries)
+
+def apply_palette(indices, palette, format_str):
+    """
+    Look up deswizzled indices in an RGBA palette table. Indices past the end
+    of the palette decode as transparent black instead of failing.
+    """
+    if palette is None:
+        raise ValueError(f"{format_str} decoding requires a palette.")
+    if indices.size and int(indices.max()) >= len(palette):
+        padded = np.zeros((int(indices.max()) + 1, 4), dtype=np.uint8)
+        padded[:len(palette)] = palette
+        palette = padded
+    return palette[indices]
 
 # ================================ C4 DECOMPRESSION ============================
-def decode_C4(file):
+def decode_C4_indices(image_data, height, width):
+    """
+    C4 => 4-bit color index, stored in 8×8 tiles like I4 => 32 bytes per tile.
+    """
+    raw = read_tiles(image_data, height, width, 8, 8, 4, "C4")
+    nibbles = np.stack((raw >> 4, raw & 0xF), axis=-1).reshape(-1)
+    return deswizzle(nibbles, height, width, 8, 8)
+
+def decode_C4(image_data, height, width, palette=None):
     """
-    4-bit color index => requires a separate palette to decode actual colors.
-    Not implemented here because the palette is not given in the file alone.
+    4-bit color index => RGBA through the image's palette table.
     """
-    raise NotImplementedError("C4 decoding requires external palette.")
+    return apply_palette(decode_C4_indices(image_data, height, width), palette, "C4")
 
 # ================================ C8 DECOMPRESSION ============================
-def decode_C8(file):
+def decode_C8_indices(image_data, height, width):
+    """
+    C8 => 8-bit color index, stored in 8×4 tiles like I8 => 32 bytes per tile.
+    """
+    raw = read_tiles(image_data, height, width, 8, 4, 8, "C8")
+    return deswizzle(raw, height, width, 8, 4)
+
+def decode_C8(image_data, height, width, palette=None):
     """
-    8-bit color index => also requires an external palette.
+    8-bit color index => RGBA through the image's palette table.
     """
-    raise NotImplementedError("C8 decoding requires external palette.")
+    return apply_palette(decode_C8_indices(image_data, height, width), palette, "C8")
 
 # ================================ C14X2 DECOMPRESSION ========================
-def decode_C14X2(file):
+def decode_C14X2_indices(image_data, height, width):
     """
-    14-bit color index => also requires an external palette.
+    C14X2 => 14-bit color index in a big-endian 16-bit word (top 2 bits unused),
+    stored in 4×4 tiles => 32 bytes per tile.
     """
-    raise NotImplementedError("C14X2 decoding requires external palette.")
+    raw = read_tiles(image_data, height, width, 4, 4, 16, "C14X2")
+    return deswizzle(raw.view('>u2'), height, width, 4, 4) & 0x3FFF
+
+def decode_C14X2(image_data, height, width, palette=None):
+    """
+    14-bit color index => RGBA through the image's palette table.
+    """
+    return apply_palette(decode_C14X2_indices(image_data, height, width), palette, "C14X2")
+
+def decode_indices(image_data, height, width, format_str):
+    """
+    Deswizzled (H,W) palette indices of a C4/C8/C14X2 image.
+    """
+    index_function_map = {
+        'C4': decode_C4_indices,
+        'C8': decode_C8_indices,
+        'C14X2': decode_C14X2_indices,
+    }
+    return index_function_map[format_str](image_data, height, width)
 
 # ================================ CMPR DECOMPRESSION ==============================
 
-def decompress_cmpr_block(block):
+def decode_CMPR(image_data, height, width):
     """
-    Decompress a single 8-byte CMPR sub-block (4x4) into a 4x4 array of RGBA values.
+    Decode the Nintendo-style CMPR (similar to DXT1) in '8x8 macro-blocks'.
+    Each 8x8 is stored as four sub-blocks of 4x4, each 8 bytes:
+      - 2 bytes c0, 2 bytes c1 (RGB565, big-endian)
+      - 4 bytes of 2-bit indices, one byte per row, first texel in the top bits
     Uses standard DXT1 logic:
       - If c0 <= c1, the 4th color is fully transparent.
       - Otherwise (c0 > c1), you get 4 opaque colors.
+    Every sub-block in the image is decoded at once.
     """
-    c0 = int.from_bytes(block[:2], 'big')
-    c1 = int.from_bytes(block[2:4], 'big')
-    color_table = block[4:]
-
-    # Decode the base colors
-    rgba0 = rgb565_to_rgba(c0)  # (r,g,b,255)
-    rgba1 = rgb565_to_rgba(c1)  # (r,g,b,255)
-
-    # Build the color palette for this block
-    colors = [rgba0, rgba1]
-
-    if c0 > c1:
-        # 4 opaque colors
-        # third color = 2/3 * col0 + 1/3 * col1
-        # fourth color = 1/3 * col0 + 2/3 * col1
-        colors.append((
-            (2*rgba0[0] + rgba1[0]) // 3,
-            (2*rgba0[1] + rgba1[1]) // 3,
-            (2*rgba0[2] + rgba1[2]) // 3,
-            255
-        ))
-        colors.append((
-            (rgba0[0] + 2*rgba1[0]) // 3,
-            (rgba0[1] + 2*rgba1[1]) // 3,
-            (rgba0[2] + 2*rgba1[2]) // 3,
-            255
-        ))
-    else:
-        # c0 <= c1 => 3rd color = average of col0 & col1; 4th color = fully transparent
-        colors.append((
-            (rgba0[0] + rgba1[0]) // 2,
-            (rgba0[1] + rgba1[1]) // 2,
-            (rgba0[2] + rgba1[2]) // 2,
-            255
-        ))
-        colors.append((0, 0, 0, 0))  # fully transparent
-
-    # Now decode 4 rows of 2-bit indices
-    # color_table[i] has 4 indices (2 bits each) for row i
-    texels_4x4 = []
-    for i in range(4):
-        row = []
-        row_val = color_table[i]
-        for j in range(4):
-            # extract 2 bits from row_val
-            idx_shift = 6 - 2*j
-            idx = (row_val >> idx_shift) & 0x03
-            row.append(colors[idx])
-        texels_4x4.append(row)
-
-    return texels_4x4
-
-def decode_CMPR(file, height, width):
+
+    macro_w = 8
+    macro_h = 8
+    blocks_wide = (width  + macro_w - 1) // macro_w
+    blocks_high = (height + macro_h - 1) // macro_h
+    n_blocks = blocks_wide * blocks_high * 4
+
+    palettes, indices = read_cmpr_blocks(image_data, height, width)
+    # gather whole RGBA texels as uint32 so each lookup moves 4 bytes at once
+    texels = np.take_along_axis(palettes.view(np.uint32)[:, :, 0], indices.reshape(n_blocks, 16), axis=1)
+    texels = texels.view(np.uint8)
+
+    # (by, bx, sub_y, sub_x, row, col) => (by, sub_y, row, bx, sub_x, col)
+    texels = texels.reshape(blocks_high, blocks_wide, 2, 2, 4, 4, 4)
+    image = texels.transpose(0, 2, 4, 1, 3, 5, 6).reshape(blocks_high * macro_h, blocks_wide * macro_w, 4)
+    image = np.ascontiguousarray(image[:height, :width])
+
+    return image
+
+def cmpr_block_array(image_data, height, width):
     """
-    Decode the Nintendo-style CMPR (similar to DXT1) in '8x8 macro-blocks'.
-    Each 8x8 is stored as four sub-blocks of 4x4, each 8 bytes.
+    The image's CMPR sub-blocks as an (N,8) uint8 array viewing the data, in
+    file order (macro-block by macro-block, four sub-blocks each).
     """
-    raw_data = file.read()
+    n_blocks = ((width + 7) // 8) * ((height + 7) // 8) * 4
+    expected_size = n_blocks * 8
+    if len(image_data) < expected_size:
+        raise ValueError("File too small for CMPR tiled data")
+    return np.frombuffer(image_data, dtype=np.uint8, count=expected_size).reshape(n_blocks, 8)
 
-    # Output image has RGBA: shape=(height, width, 4)
-    image = np.zeros((height, width, 4), dtype=np.uint8)
+def read_cmpr_blocks(image_data, height, width):
+    """
+    Split CMPR data into its sub-blocks (see cmpr_block_array). Returns their
+    (N,4,4) RGBA palettes and (N,4,4) 2-bit indices by row and column.
+    """
+    blocks = cmpr_block_array(image_data, height, width)
 
-    macro_w = 8
-    macro_h = 8
-    blocks_wide = width  // macro_w
-    blocks_high = height // macro_h
-
-    offset = 0
-    # For each 8x8 macro-block
-    for by in range(blocks_high):
-        for bx in range(blocks_wide):
-            # 4 sub-blocks in each 8x8
-            for subb in range(4):
-                sub_data = raw_data[offset : offset+8]
-                offset += 8
-                # Decompress the 4x4 block to RGBA
-                block_4x4 = decompress_cmpr_block(sub_data)
-
-                # subb=0 => top-left; subb=1 => top-right
-                # subb=2 => bottom-left; subb=3 => bottom-right
-                sub_y = (subb // 2) * 4
-                sub_x = (subb % 2)  * 4
-
-                # Place in final image
-                top = by * macro_h
-                left = bx * macro_w
-                for row in range(4):
-                    for col in range(4):
-                        iy = top + sub_y + row
-                        ix = left + sub_x + col
-                        # Safety check
-                        if iy < height and ix < width:
-                            image[iy, ix] = block_4x4[row][col]
-
-    decode_and_save(image, file.name, height, width)
+    # Decode the base colors of every sub-block
+    c0 = blocks[:, 0:2].copy().view('>u2')[:, 0]
+    c1 = blocks[:, 2:4].copy().view('>u2')[:, 0]
+    palettes = cmpr_palettes(c0, c1)
+
+    # Expand the 2-bit indices => (n_blocks, 4 rows, 4 cols)
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    indices = (blocks[:, 4:8, None] >> shifts) & 0x03
+    return palettes, indices
+
+def cmpr_palettes(c0, c1):
+    """
+    Build the (N,4,4) RGBA palette of every CMPR sub-block from its RGB565
+    base colors (also used by encode.py to pick indices).
+    """
+    opaque = (c0 > c1)[:, None]
+    palettes = np.empty((len(c0), 4, 4), dtype=np.uint8)
+    palettes[:, 0] = colorTables.lookup(colorTables.rgb565_table(), c0)
+    palettes[:, 1] = colorTables.lookup(colorTables.rgb565_table(), c1)
+    palettes[:, 2:, 3] = 255
+    rgb0 = palettes[:, 0, :3].astype(np.uint16)
+    rgb1 = palettes[:, 1, :3].astype(np.uint16)
+    # c0 > c1 => third color = 2/3 * col0 + 1/3 * col1, fourth = 1/3 * col0 + 2/3 * col1
+    # c0 <= c1 => third color = average of col0 & col1; fourth = fully transparent
+    palettes[:, 2, :3] = np.where(opaque, (2*rgb0 + rgb1) // 3, (rgb0 + rgb1) // 2)
+    palettes[:, 3, :3] = np.where(opaque, (rgb0 + 2*rgb1) // 3, 0)
+    palettes[:, 3, 3] = np.where(opaque[:, 0], 255, 0)
+    return palettes
 
 # ================================ ================= ==============================
 # ================================ DECOMPRESSION END ==============================
 # ================================ ================= ==============================
 
-def get_format_function(format_str):
-    # Return the decoding function based on the format string
-    format_function_map = {
+# -----------------------------------------------------------------------------
+#                           DECODER REGISTRY
+# -----------------------------------------------------------------------------
+
+# Every format can have several implementations, all with byte-identical output:
+#   numpy           the decode_* functions above
+#   numba           numbaDecode's compiled kernels, when Numba is installed
+#   numba-parallel  those kernels on a thread per band of tile rows, for
+#                   large images on machines with several cores
+# Each is registered with the image sizes it's worth trying at and whether
+# it spreads over threads. By default ("auto") every image goes to the one
+# decoderCalibration measured as fastest on this machine for its format at
+# the nearest size. Uncalibrated, images of NUMBA_MIN_PIXELS and up go to
+# numba when it's installed and everything else to numpy: each process pays
+# for importing Numba and loading the cached kernels on first use, which
+# small textures never earn back.
+# Any other backend forces that implementation (numpy for formats it lacks).
+Decoder = collections.namedtuple("Decoder", ["name", "func", "min_pixels", "max_pixels", "parallel"])
+DECODERS = {}
+DEFAULT_BACKEND = "auto"
+
+# Below this, handing bands to threads costs more than it saves
+PARALLEL_MIN_PIXELS = 256 * 256
+# Uncalibrated, smaller images stay on numpy
+NUMBA_MIN_PIXELS = 256 * 256
+
+# Cleared in pool worker processes (_init_pool_worker), which already keep
+# every core busy, so automatic dispatch doesn't start threads of its own
+ALLOW_PARALLEL = True
+
+def register_decoder(format_str, name, func, min_pixels=0, max_pixels=None, parallel=False):
+    """
+    Add an implementation of format_str: func(image_data, height, width),
+    plus an RGBA palette table for C4/C8/C14X2, returning the same (H,W,4)
+    RGBA array as every other one. Automatic dispatch only considers it for
+    images of min_pixels..max_pixels pixels, and parallel ones only where
+    ALLOW_PARALLEL.
+    """
+    DECODERS.setdefault(format_str, {})[name] = Decoder(name, func, min_pixels, max_pixels, parallel)
+
+def candidate_decoders(format_str, height, width, parallel=None):
+    """
+    The implementations of format_str worth trying on a height x width
+    image; parallel ones only if parallel (default: ALLOW_PARALLEL).
+    """
+    parallel = ALLOW_PARALLEL if parallel is None else parallel
+    pixels = height * width
+    return [decoder for decoder in DECODERS.get(format_str, {}).values()
+            if decoder.min_pixels <= pixels and (decoder.max_pixels is None or pixels <= decoder.max_pixels)
+            and (parallel or not decoder.parallel)]
+
+def select_decoder(format_str, height=None, width=None, backend=None):
+    """
+    The Decoder for a height x width format_str image (None if the format
+    has none): the forced backend's, or with backend "auto"/None the
+    calibrated fastest candidate (see decoderCalibration). Uncalibrated,
+    that's numba's from NUMBA_MIN_PIXELS up if there is one, else numpy's
+    (also when the size isn't known).
+    """
+    decoders = DECODERS.get(format_str)
+    if not decoders:
+        return None
+    backend = backend or DEFAULT_BACKEND
+    if backend != "auto":
+        if backend not in imageStream.BACKENDS:
+            raise ValueError(f"Unknown decoder backend {backend}.")
+        return decoders.get(backend) or decoders["numpy"]
+    if height is not None and width is not None:
+        candidates = {decoder.name: decoder for decoder in candidate_decoders(format_str, height, width)}
+        fastest = decoderCalibration.fastest(format_str, height * width)
+        if fastest in candidates:
+            return candidates[fastest]
+        if height * width >= NUMBA_MIN_PIXELS and "numba" in decoders:
+            return decoders["numba"]
+    return decoders["numpy"]
+
+def _init_pool_worker():
+    global ALLOW_PARALLEL
+    ALLOW_PARALLEL = False
+
+def jit_decoder(format_str):
+    """
+    numbaDecode's kernel for format_str with decode_<format>'s signature
+    and size check, or None if there isn't one. Numba is only imported
+    (and the kernel compiled) on the first call.
+    """
+    if not numbaDecode.AVAILABLE or format_str not in numbaDecode.KERNEL_FORMATS:
+        return None
+    format_id = imageStream.FORMAT_IDS[format_str]
+    tile_w, tile_h, bits_per_pixel = imageStream.FORMAT_TILES[format_id]
+
+    def decode_func(image_data, height, width):
+        raw = read_tiles(image_data, height, width, tile_w, tile_h, bits_per_pixel, format_str)
+        kernel = numbaDecode.kernel(format_str)
+        if kernel is None:
+            # Numba turned out to be broken
+            return DECODERS[format_str]["numpy"].func(image_data, height, width)
+        return kernel(raw, height, width)
+    return decode_func
+
+def decode_parallel(image_data, height, width, format_str):
+    """
+    numbaDecode's kernel for format_str run on a thread per core, each on a
+    band of whole tile rows (a contiguous run of the data that decodes like
+    an image of its own); the kernels release the GIL.
+    """
+    global _decode_threads
+    kernel = numbaDecode.kernel(format_str)
+    if kernel is None:
+        # Numba turned out to be broken, as in jit_decoder
+        return DECODERS[format_str]["numpy"].func(image_data, height, width)
+    format_id = imageStream.FORMAT_IDS[format_str]
+    tile_w, tile_h, bits_per_pixel = imageStream.FORMAT_TILES[format_id]
+    raw = read_tiles(image_data, height, width, tile_w, tile_h, bits_per_pixel, format_str)
+    tiles_y = (height + tile_h - 1) // tile_h
+    row_size = ((width + tile_w - 1) // tile_w) * tile_w * tile_h * bits_per_pixel // 8
+
+    workers = os.cpu_count() or 1
+    if _decode_threads is None:
+        _decode_threads = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+    band = (tiles_y + workers - 1) // workers
+    image = np.empty((height, width, 4), dtype=np.uint8)
+
+    def decode_band(ty):
+        y = ty * tile_h
+        rows = min(band * tile_h, height - y)
+        image[y:y + rows] = kernel(raw[ty * row_size:(ty + band) * row_size], rows, width)
+    list(_decode_threads.map(decode_band, range(0, tiles_y, band)))
+    return image
+
+# Threads for decode_parallel, started on first use
+_decode_threads = None
+
+def _register_builtin_decoders():
+    numpy_decoders = {
         'I4': decode_I4,
         'I8': decode_I8,
         'IA4': decode_IA4,
@@ -597,37 +583,801 @@ def get_format_function(format_str):
         'C14X2': decode_C14X2,
         'CMPR': decode_CMPR
     }
+    for format_str, decode_func in numpy_decoders.items():
+        register_decoder(format_str, "numpy", decode_func)
+        jit_func = jit_decoder(format_str)
+        if jit_func:
+            register_decoder(format_str, "numba", jit_func)
+            if (os.cpu_count() or 1) > 1:
+                register_decoder(format_str, "numba-parallel", functools.partial(decode_parallel, format_str=format_str),
+                                 min_pixels=PARALLEL_MIN_PIXELS, parallel=True)
+
+_register_builtin_decoders()
+
+def get_format_function(format_str, backend=None):
+    # Return the decoding function based on the format string (and backend, see select_decoder)
+    decoder = select_decoder(format_str, backend=backend)
+    return decoder.func if decoder else None
+
+def decode_image(image_data, height, width, format_str, palette=None, backend=None):
+    """
+    Decode one image's raw bytes (any bytes-like object) into a (H,W,4) RGBA array.
+    palette is (palette_data, palette_format) for C4/C8/C14X2 images.
+    backend is one of imageStream.BACKENDS (default: DEFAULT_BACKEND, see select_decoder).
+    """
+    if format_str not in FORMATS:
+        raise ValueError(f"Invalid format {format_str}.")
+    decoder = select_decoder(format_str, height, width, backend)
+    decode_func = decoder.func if decoder else None
+    if not decode_func:
+        raise ValueError(f"No decoder function available for format {format_str}.")
+    if format_str in imageStream.PALETTED_FORMATS:
+        return decode_func(image_data, height, width, decode_palette(*palette) if palette else None)
+    return decode_func(image_data, height, width)
+
+# -----------------------------------------------------------------------------
+#                           PREVIEW DECODING
+# -----------------------------------------------------------------------------
+
+# Previews are 1/PREVIEW_SCALE of the image on each side: one pixel per CMPR
+# sub-block, which is what makes CMPR previews cheap
+PREVIEW_SCALE = 4
+
+def preview_size(height, width):
+    return (height + PREVIEW_SCALE - 1) // PREVIEW_SCALE, (width + PREVIEW_SCALE - 1) // PREVIEW_SCALE
+
+# preview_CMPR packs a color's R, G and B into LANE_BITS-bit lanes of one
+# int64, so each step works on all three channels with one array operation.
+# Lanes never overflow: the largest value one holds is 16 texels * 255.
+LANE_BITS = 21
+LANE_MASK = (1 << LANE_BITS) - 1
+LANES_ONE = 1 | (1 << LANE_BITS) | (1 << 2 * LANE_BITS)
+_rgb565_lanes = None
+# Alpha of a whole CMPR sub-block's preview pixel, by its number of clear texels
+CMPR_PREVIEW_ALPHA = np.array([(255 * (16 - k) + 8) >> 4 for k in range(17)], dtype=np.uint8)
+
+def rgb565_lanes():
+    """
+    65536-entry int64 table: every RGB565 color's expanded R, G and B in
+    lanes (see LANE_BITS).
+    """
+    global _rgb565_lanes
+    if _rgb565_lanes is None:
+        rgb = colorTables.rgb565_table()[:, :3].astype(np.int64)
+        _rgb565_lanes = rgb[:, 0] | (rgb[:, 1] << LANE_BITS) | (rgb[:, 2] << 2 * LANE_BITS)
+    return _rgb565_lanes
+
+def lane_div3(lanes):
+    # Per-lane floor division by 3: (x * 683) >> 11 == x // 3 for every x <= 765,
+    # and the bits the shift brings down from the lane above stay above bit 9
+    return ((lanes * 683) >> 11) & (0x3FF * LANES_ONE)
+
+def preview_CMPR(image_data, height, width):
+    """
+    Quarter-scale CMPR straight from the sub-blocks, without expanding a
+    single texel: each 4x4 sub-block becomes one pixel, the average of its
+    palette colors weighted by how many of its texels (inside the image)
+    use each index. Palette colors and sums are kept packed in lanes
+    (see LANE_BITS), so it's all flat array arithmetic on one int64 per
+    sub-block.
+    """
+    blocks_wide = (width  + 7) // 8
+    blocks_high = (height + 7) // 8
+    blocks = cmpr_block_array(image_data, height, width)
+    n_blocks = len(blocks)
+    words = blocks.view('>u2')
+    c0 = words[:, 0]
+    c1 = words[:, 1]
+    opaque = c0 > c1
+
+    # The four palette colors, as in cmpr_palettes
+    lanes = rgb565_lanes()
+    p0 = lanes[c0]
+    p1 = lanes[c1]
+    # (2*p0 + p1) / 3 when opaque, else (p0 + p1) / 2: x*683 >> 11 and
+    # x*1024 >> 11 in every lane (see lane_div3)
+    p2 = ((p0 + p1 + opaque * p0) * np.where(opaque, 683, 1024) >> 11) & (0x3FF * LANES_ONE)
+    p3 = lane_div3(p0 + 2 * p1) * opaque
+
+    # Index histogram per sub-block: cmpr_row_counts packs a row's counts per
+    # index into the bytes of a uint32, so adding rows adds every index's
+    # count (at most 16) at once; cmpr_pair_counts does two rows per lookup
+    pair_counts = cmpr_pair_counts()
+    counts = pair_counts[words[:, 2]] + pair_counts[words[:, 3]]
+    # Edge sub-blocks (only in the last macro-block row/column) only count
+    # the rows/columns that are inside the image
+    edge = ()
+    if height % 8 or width % 8:
+        rows = np.clip(height - (np.arange(blocks_high)[:, None] * 8 + np.arange(2) * 4), 0, 4)
+        cols = np.clip(width - (np.arange(blocks_wide)[:, None] * 8 + np.arange(2) * 4), 0, 4)
+        edge = np.flatnonzero(((rows < 4)[:, None, :, None] | (cols < 4)[None, :, None, :]).reshape(-1))
+    if len(edge):
+        by, bx, sy, sx = np.unravel_index(edge, (blocks_high, blocks_wide, 2, 2))
+        rows, cols = rows[by, sy], cols[bx, sx]
+        edge_counts = cmpr_row_counts()[cols[:, None], blocks[edge, 4:8]]
+        edge_counts[np.arange(4) >= rows[:, None]] = 0
+        counts[edge] = edge_counts.sum(axis=1, dtype=np.uint32)
+    n = counts.view(np.uint8).reshape(n_blocks, 4).T
+    if sys.byteorder == "big":
+        n = n[::-1]
+
+    sums = n[0] * p0
+    sums += n[1] * p1
+    sums += n[2] * p2
+    sums += n[3] * p3
+    # Only index 3 of a transparent sub-block has alpha 0
+    clear = n[3] * ~opaque
+    # Whole sub-blocks average 16 texels, a shift; only edge ones need a division
+    pixels = np.empty((n_blocks, 4), dtype=np.uint8)
+    sums += 8 * LANES_ONE
+    for ch in range(3):
+        pixels[:, ch] = (sums >> (ch * LANE_BITS + 4)) & 0xFF
+    pixels[:, 3] = CMPR_PREVIEW_ALPHA[clear]
+    if len(edge):
+        sums = sums[edge] - 8 * LANES_ONE
+        totals = np.maximum(rows * cols, 1)
+        for ch in range(3):
+            pixels[edge, ch] = (((sums >> (ch * LANE_BITS)) & LANE_MASK) + totals // 2) // totals
+        pixels[edge, 3] = (255 * (totals - clear[edge]) + totals // 2) // totals
+
+    # (by, bx, sub_y, sub_x) => (by, sub_y, bx, sub_x)
+    preview = pixels.reshape(blocks_high, blocks_wide, 2, 2, 4).transpose(0, 2, 1, 3, 4)
+    preview = preview.reshape(blocks_high * 2, blocks_wide * 2, 4)
+    preview_h, preview_w = preview_size(height, width)
+    return np.ascontiguousarray(preview[:preview_h, :preview_w])
+
+def preview_tiled(image_data, height, width, format_str, palette=None):
+    """
+    Quarter-scale preview of a tiled (non-CMPR) image: the top-left texel of
+    every 4x4 pixel cell is read straight out of its tile, so only one
+    texel in 16 is ever touched. palette is an (N,4) RGBA palette table for
+    C4/C8/C14X2 images.
+    """
+    format_id = imageStream.FORMAT_IDS.get(format_str)
+    if format_id not in imageStream.FORMAT_TILES:
+        raise ValueError(f"Invalid format {format_str}.")
+    tile_w, tile_h, bits_per_pixel = imageStream.FORMAT_TILES[format_id]
+    raw = read_tiles(image_data, height, width, tile_w, tile_h, bits_per_pixel, format_str)
+    tiles_x = (width + tile_w - 1) // tile_w
+
+    # File order index of each sampled texel: its tile, then its place in the tile
+    ys = np.arange(0, height, PREVIEW_SCALE)[:, None]
+    xs = np.arange(0, width, PREVIEW_SCALE)[None, :]
+    texel = ((ys // tile_h) * tiles_x + xs // tile_w) * (tile_w * tile_h) + (ys % tile_h) * tile_w + xs % tile_w
+
+    if bits_per_pixel == 4:
+        # top nibble = first texel of the byte
+        val = np.where(texel % 2 == 0, raw[texel // 2] >> 4, raw[texel // 2] & 0xF)
+    elif bits_per_pixel == 8:
+        val = raw[texel]
+    elif bits_per_pixel == 16:
+        val = raw.view('>u2')[texel]
+    else:
+        # RGBA32 texels are already RGBA
+        return np.ascontiguousarray(raw.reshape(-1, 4)[texel])
+
+    if format_str in imageStream.PALETTED_FORMATS:
+        return apply_palette(val & 0x3FFF if format_str == 'C14X2' else val, palette, format_str)
+    if format_str == 'I4':
+        val = val * 17
+    return colorTables.lookup(TEXEL_TABLES[format_str](), val)
+
+_cmpr_row_counts = None
+
+def cmpr_row_counts():
+    """
+    (5, 256) table: for a CMPR index row byte and how many of its texels
+    (0-4, from the left) are inside the image, how often each index occurs,
+    one byte per index packed into a native uint32.
+    """
+    global _cmpr_row_counts
+    if _cmpr_row_counts is None:
+        indices = (np.arange(256)[:, None] >> np.array([6, 4, 2, 0])) & 0x03
+        counts = np.zeros((5, 256, 4), dtype=np.uint8)
+        for cols in range(5):
+            for col in range(cols):
+                counts[cols, np.arange(256), indices[:, col]] += 1
+        _cmpr_row_counts = counts.view(np.uint32)[..., 0]
+    return _cmpr_row_counts
+
+_cmpr_pair_counts = None
+
+def cmpr_pair_counts():
+    """
+    65536-entry table: cmpr_row_counts of two whole index rows at once, by
+    the big-endian 16-bit value of their two bytes.
+    """
+    global _cmpr_pair_counts
+    if _cmpr_pair_counts is None:
+        row_counts = cmpr_row_counts()[4]
+        _cmpr_pair_counts = (row_counts[:, None] + row_counts[None, :]).reshape(-1)
+    return _cmpr_pair_counts
+
+def decode_preview(image_data, height, width, format_str, palette=None, backend=None):
+    """
+    Decode a 1/PREVIEW_SCALE size (ceil(H/4), ceil(W/4), 4) RGBA preview of
+    an image for thumbnails (see contactSheet.py), at a fraction of the cost
+    of decode_image. palette is (palette_data, palette_format) for
+    C4/C8/C14X2 images; backend is as for decode_image.
+    """
+    if format_str not in FORMATS:
+        raise ValueError(f"Invalid format {format_str}.")
+    # The Numba preview wherever the full decode would use Numba, and for
+    # CMPR (whose preview is the one worth a kernel) unless numpy is forced
+    decoder = select_decoder(format_str, height, width, backend)
+    use_numba = decoder.name.startswith("numba") or (format_str == 'CMPR' and (backend or DEFAULT_BACKEND) != "numpy")
+    kernel = numbaDecode.preview_kernel(format_str) if use_numba else None
+    if kernel:
+        return kernel(read_tiles(image_data, height, width, 8, 8, 4, format_str), height, width)
+    if format_str == 'CMPR':
+        return preview_CMPR(image_data, height, width)
+    lut = decode_palette(*palette) if palette and format_str in imageStream.PALETTED_FORMATS else None
+    return preview_tiled(image_data, height, width, format_str, lut)
+
+# -----------------------------------------------------------------------------
+#                           REGION DECODING
+# -----------------------------------------------------------------------------
+
+def decode_region(image_data, height, width, format_str, x, y, w, h, palette=None, backend=None):
+    """
+    Decode only the w x h rectangle at (x, y) of an image, e.g. one cell of
+    a sprite sheet, as a (h,w,4) RGBA array equal to
+    decode_image(...)[y:y+h, x:x+w]. Only the tiles (CMPR macro-blocks)
+    covering the rectangle are read: a contiguous run of them per row of
+    tiles, gathered into a small image of their own and decoded as usual,
+    so with a memory-mapped TPL the cost follows the region's size rather
+    than the image's. palette and backend are as for decode_image.
+    """
+    if format_str not in FORMATS:
+        raise ValueError(f"Invalid format {format_str}.")
+    if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > width or y + h > height:
+        raise ValueError(f"Region {w}x{h} at ({x},{y}) is outside the {width}x{height} image.")
+    format_id = imageStream.FORMAT_IDS[format_str]
+    tile_w, tile_h, bits_per_pixel = imageStream.FORMAT_TILES[format_id]
+    tile_size = tile_w * tile_h * bits_per_pixel // 8
+    tiles_x = (width  + tile_w - 1) // tile_w
+    tiles_y = (height + tile_h - 1) // tile_h
+    if len(image_data) < tiles_x * tiles_y * tile_size:
+        raise ValueError(f"File too small for {format_str} tiled data")
+
+    # Tiles covering the region: columns tx0..tx1-1 of rows ty0..ty1-1
+    tx0, tx1 = x // tile_w, (x + w + tile_w - 1) // tile_w
+    ty0, ty1 = y // tile_h, (y + h + tile_h - 1) // tile_h
+    view = memoryview(image_data)
+    row_size = tiles_x * tile_size
+    tiles = b"".join(view[ty * row_size + tx0 * tile_size:ty * row_size + tx1 * tile_size] for ty in range(ty0, ty1))
+
+    image = decode_image(tiles, (ty1 - ty0) * tile_h, (tx1 - tx0) * tile_w, format_str, palette, backend)
+    top, left = y - ty0 * tile_h, x - tx0 * tile_w
+    return np.ascontiguousarray(image[top:top + h, left:left + w])
+
+# -----------------------------------------------------------------------------
+#                           STREAMING DECODING
+# -----------------------------------------------------------------------------
+
+def decode_strips(image_data, height, width, format_str, palette=None, backend=None):
+    """
+    Decode an image one row of tiles (4 or 8 pixel rows, per format) at a
+    time, yielding (rows, W, 4) RGBA strips top to bottom. A row of tiles
+    is a contiguous run of the image data and decodes like an image of its
+    own, so only one strip is ever held in memory.
+    palette is (palette_data, palette_format) for C4/C8/C14X2 images.
+    """
+    format_id = imageStream.FORMAT_IDS.get(format_str)
+    if format_id not in imageStream.FORMAT_TILES:
+        raise ValueError(f"Invalid format {format_str}.")
+    # Strips are decoded one at a time, so the decoder is picked for a strip's size
+    tile_h = imageStream.FORMAT_TILES[format_id][1]
+    decoder = select_decoder(format_str, min(tile_h, height), width, backend)
+    decode_func = decoder.func if decoder else None
+    if not decode_func:
+        raise ValueError(f"No decoder function available for format {format_str}.")
+
+    tile_w, tile_h, bits_per_pixel = imageStream.FORMAT_TILES[format_id]
+    tiles_x = (width + tile_w - 1) // tile_w
+    row_size = tiles_x * tile_w * tile_h * bits_per_pixel // 8
+    if len(image_data) < row_size * ((height + tile_h - 1) // tile_h):
+        raise ValueError(f"File too small for {format_str} tiled data")
+
+    lut = None
+    if format_str in imageStream.PALETTED_FORMATS and palette:
+        lut = decode_palette(*palette)
+    for row_idx, y in enumerate(range(0, height, tile_h)):
+        strip_data = image_data[row_idx * row_size:(row_idx + 1) * row_size]
+        rows = min(tile_h, height - y)
+        if format_str in imageStream.PALETTED_FORMATS:
+            yield decode_func(strip_data, rows, width, lut)
+        else:
+            yield decode_func(strip_data, rows, width)
+
+def stream_to_png(image_data, height, width, format_str, out_name, palette=None,
+                  compress_level=savePipeline.PNG_COMPRESS_LEVEL, optimize=False, backend=None):
+    """
+    Decode an image strip by strip straight into a PNG (see decode_strips),
+    so peak memory is proportional to width x tile height.
+    """
+    strips = decode_strips(image_data, height, width, format_str, palette, backend)
+    # Pillow's optimize comes down to maximum zlib compression for these images
+    with pngWriter.PNGWriter(out_name, width, height, 9 if optimize else compress_level) as png:
+        for strip in strips:
+            png.write_rows(strip)
+
+def decode_one(img_index, image_data, height, width, format_str, palette=None, output_dir="tex", options=None, level=0,
+               bundle_slot=None, recorder=None, saver=None):
+    """
+    Decode and save a single image. Returns (error, cache_hit): the error
+    message is returned instead of raised if the image can't be decoded,
+    so pool workers can report it.
+
+    options is the per-run settings dict shared by every image:
+      cache       => decodeCache.DecodeCache to reuse earlier decodes from
+      png_palette => save indexed images with <= 256 colors as "P" PNGs
+      mip_levels  => extra mip levels to extract, a list or "all" (see tpl_tasks)
+      dds         => write CMPR images (with their mip chain) as BC1 .dds files
+                     instead of decoding them
+      stream      => decode RGBA PNGs a row of tiles at a time (stream_to_png)
+      png_compress_level, png_optimize => PNG zlib settings (png_settings)
+      backend     => decoder implementation, one of imageStream.BACKENDS (default: DEFAULT_BACKEND)
+
+    saver is a savePipeline.SavePipeline to hand the PNG encode and write
+    to, so the caller can decode the next image meanwhile; the file is only
+    complete once the saver is closed. Without one the image is saved here.
+
+    bundle_slot is (blob_path, offset) to write the decoded RGBA into a
+    bundle blob instead of a file of its own (see decode_bundle).
+
+    recorder is a profiler.ImageRecorder when the run is profiled (--profile);
+    the cache, decode and save stages are timed on it, and it's finished
+    once the output is written.
+    """
+    options = options or {}
+    backend = options.get("backend")
+    if bundle_slot:
+        try:
+            with profiler.span(recorder, "decode"):
+                image = decode_image(image_data, height, width, format_str, palette, backend)
+        except (ValueError, NotImplementedError) as e:
+            return str(e), False
+        with profiler.span(recorder, "save"):
+            bundle.write_image(*bundle_slot, image)
+        if recorder:
+            recorder.bytes_written += image.nbytes
+            recorder.finish()
+        return None, False
+
+    cache = options.get("cache")
+    variant, ext = output_kind(format_str, palette, options)
+    kind = variant.partition("+")[0]
+    paletted = kind == "P"
+    as_dds = kind == "DDS"
+
+    key = None
+    if cache:
+        key = cache.key(image_data, format_str, height, width, palette, variant)
+        os.makedirs(output_dir, exist_ok=True)
+        with profiler.span(recorder, "cache"):
+            hit = cache.fetch(key, output_path(img_index, output_dir, level, ext))
+        if hit:
+            if recorder:
+                recorder.wrote(output_path(img_index, output_dir, level, ext))
+                recorder.finish()
+            return None, True
+
+    png = png_settings(options)
+    save = None
+    try:
+        if as_dds:
+            os.makedirs(output_dir, exist_ok=True)
+            output_filepath = output_path(img_index, output_dir, level, ext)
+            with profiler.span(recorder, "save"):
+                dds.save_cmpr_as_dds(image_data, width, height, output_filepath)
+        elif paletted:
+            with profiler.span(recorder, "decode"):
+                indices = decode_indices(image_data, height, width, format_str)
+                lut = decode_palette(*palette)
+                if len(lut) > 256 or (indices.size and int(indices.max()) >= len(lut)):
+                    indices, lut = apply_palette(indices, lut, format_str), None
+            save = functools.partial(decode_and_save, indices, img_index, output_dir, lut, level, **png)
+        elif options.get("stream"):
+            os.makedirs(output_dir, exist_ok=True)
+            output_filepath = output_path(img_index, output_dir, level, ext)
+            # Decoding and saving are interleaved per strip, so they are timed together
+            with profiler.span(recorder, "decode"):
+                stream_to_png(image_data, height, width, format_str, output_filepath, palette, **png, backend=backend)
+        else:
+            with profiler.span(recorder, "decode"):
+                image = decode_image(image_data, height, width, format_str, palette, backend)
+            save = functools.partial(decode_and_save, image, img_index, output_dir, None, level, **png)
+    except (ValueError, NotImplementedError) as e:
+        return str(e), False
+
+    if save is None:
+        finish_output(output_filepath, recorder, cache, key)
+    elif saver:
+        saver.submit(save_output, save, recorder, cache, key)
+    else:
+        save_output(save, recorder, cache, key)
+    return None, False
+
+def save_output(save, recorder=None, cache=None, key=None):
+    """
+    Run decode_one's deferred save (on a SavePipeline thread when it has
+    one), then finish_output the file it wrote.
+    """
+    with profiler.span(recorder, "save"):
+        output_filepath = save()
+    finish_output(output_filepath, recorder, cache, key)
+
+def finish_output(output_filepath, recorder=None, cache=None, key=None):
+    # Only once the file is complete can it be measured and copied into the cache
+    if recorder:
+        recorder.wrote(output_filepath)
+    if cache:
+        with profiler.span(recorder, "cache"):
+            cache.store(key, output_filepath)
+    if recorder:
+        recorder.finish()
+
+# -----------------------------------------------------------------------------
+#                           PARALLEL DECODING
+# -----------------------------------------------------------------------------
 
-    return format_function_map.get(format_str)
+# The TPL mapping most recently opened by this (worker) process. Tasks come
+# in file order, so one open mapping at a time is enough and batch runs
+# over thousands of files don't pile up open handles. It's keyed on the
+# file's size and mtime too, as long-lived workers (decodeWorker.py) may
+# see the same path again after it was rewritten.
+_worker_tpl = (None, None)
+
+def _worker_buffer(tpl_file):
+    global _worker_tpl
+    stat = os.stat(tpl_file)
+    key = (tpl_file, stat.st_size, stat.st_mtime_ns)
+    if _worker_tpl[0] != key:
+        _worker_tpl = (None, None)
+        with open(tpl_file, "rb") as file:
+            _worker_tpl = (key, imageStream.map_tpl(file))
+    return _worker_tpl[1]
+
+# One image (mip level) to decode. Only offsets into the TPL are passed to workers,
+# never pixel bytes: palette is None or (palette_addr, palette_length, palette_format)
+DecodeTask = collections.namedtuple("DecodeTask", [
+    "tpl_file", "img_index", "data_addr", "length", "height", "width",
+    "format_str", "palette", "output_dir", "options", "level", "bundle_slot",
+], defaults=(0, None))
+
+def _decode_tasks(tasks):
+    """
+    Pool worker: tasks carry only the TPL path and each image's offset/length,
+    the worker slices the bytes out of its own mapping of the file.
+    """
+    return run_batch(tasks)
+
+def task_batches(tasks, workers=1):
+    """
+    Split tasks, in order, into batches for run_batch: about eight per worker,
+    so batches of small images aren't dominated by IPC round trips while
+    the load still evens out across workers.
+    """
+    size = max(1, len(tasks) // (workers * 8))
+    return [tasks[start:start + size] for start in range(0, len(tasks), size)]
+
+def run_batch(tasks, buffer=None):
+    """
+    Run tasks one after another in this process, with their PNG saves on a
+    savePipeline.SavePipeline (options["png_threads"] threads) so each
+    image's encode overlaps the next one's decode. buffer is the contents of
+    the tasks' TPL; by default each task's file is mapped (_worker_buffer).
+    Returns (img_index, error, cache_hit, profile summary or None) per task,
+    once every output has been written.
+    """
+    options = (tasks[0].options if tasks else None) or {}
+    results = []
+    with savePipeline.SavePipeline(options.get("png_threads", savePipeline.DEFAULT_THREADS)) as saver:
+        for task in tasks:
+            results.append(run_task(task, _worker_buffer(task.tpl_file) if buffer is None else buffer, saver))
+    return [(img_index, error, cache_hit, recorder.summary() if recorder else None)
+            for img_index, error, cache_hit, recorder in results]
+
+def run_task(task, buffer, saver=None):
+    """
+    Decode one task's image out of buffer, the contents of task.tpl_file.
+    Returns (img_index, error, cache_hit, profiler.ImageRecorder or None);
+    with a saver (see decode_one) the recorder is only complete once the
+    saver is closed.
+    """
+    recorder = None
+    if task.options and task.options.get("profile"):
+        name = output_path(task.img_index, os.path.relpath(task.output_dir), task.level, "")
+        recorder = profiler.ImageRecorder(name.replace(os.sep, "/"), task.length + (task.palette[1] if task.palette else 0))
+
+    with profiler.span(recorder, "read"):
+        view = memoryview(buffer)
+        image_data = view[task.data_addr:task.data_addr + task.length]
+        palette = None
+        if task.palette:
+            palette_addr, palette_length, palette_format = task.palette
+            palette = (view[palette_addr:palette_addr + palette_length], palette_format)
+    error, cache_hit = decode_one(task.img_index, image_data, task.height, task.width, task.format_str, palette,
+                                  task.output_dir, task.options, task.level, task.bundle_slot, recorder, saver)
+    return task.img_index, error, cache_hit, recorder
+
+def tpl_tasks(tpl_file, output_dir="tex", options=None):
+    """
+    Parse a TPL file into one decode task per image for run_task, plus
+    one per extra mip level requested in options["mip_levels"]. In DDS mode
+    a CMPR task covers the image's whole mip chain instead.
+    """
+    with open(tpl_file, "rb") as file:
+        buffer = imageStream.map_tpl(file)
+    return buffer_tasks(buffer, os.path.abspath(tpl_file), output_dir, options)
+
+def buffer_tasks(buffer, tpl_path, output_dir="tex", options=None):
+    """
+    tpl_tasks for a TPL already in memory; tpl_path is what the tasks (and
+    their error messages) refer to it by.
+    """
+    mip_levels = (options or {}).get("mip_levels") or []
+    as_dds = bool((options or {}).get("dds"))
+    tasks = []
+    for img_idx, image in enumerate(imageStream.parse_tpl(buffer)):
+        format_name = image.format_name
+        palette = None
+        if image.palette_addr is not None:
+            palette = (image.palette_addr, image.palette_entries * 2, image.palette_format)
+        if as_dds and format_name == "CMPR":
+            levels = [level for level in imageStream.image_levels(image) if level[1] + level[2] <= len(buffer)]
+            length = sum(size for _, _, size, _, _ in levels) or image.data_size
+            tasks.append(DecodeTask(tpl_path, img_idx + 1, image.data_addr, length,
+                                    image.height, image.width, format_name, palette, output_dir, options))
+            continue
+
+        tasks.append(DecodeTask(tpl_path, img_idx + 1, image.data_addr, image.data_size,
+                                image.height, image.width, format_name, palette, output_dir, options))
+
+        # Levels missing from the header (or past the end of the file) are skipped
+        for level, data_addr, size, width, height in imageStream.image_levels(image)[1:]:
+            if (mip_levels == "all" or level in mip_levels) and data_addr + size <= len(buffer):
+                tasks.append(DecodeTask(tpl_path, img_idx + 1, data_addr, size, height, width,
+                                        format_name, palette, output_dir, options, level))
+    return tasks
+
+def incremental_tasks(tpl_file, output_dir="tex", options=None):
+    """
+    tpl_tasks, minus the images that an earlier extraction into output_dir
+    already wrote from the same bytes (see extractManifest). Returns
+    (tasks, manifest to write once they have run or None, number of images
+    skipped). options["force"] re-decodes everything.
+    """
+    options = options or {}
+    force = options.get("force")
+    stat = os.stat(tpl_file)
+    old = None if force else extractManifest.load_manifest(output_dir)
+    if extractManifest.up_to_date(old, stat, options, output_dir):
+        return [], None, len(old["images"])
+
+    with open(tpl_file, "rb") as file:
+        buffer = imageStream.map_tpl(file)
+    tpl_path = os.path.abspath(tpl_file)
+    tpl_hash = extractManifest.file_hash(buffer)
+    manifest = extractManifest.new_manifest(tpl_path, stat, tpl_hash, options)
+    if extractManifest.up_to_date(old, stat, options, output_dir, tpl_hash):
+        # Touched but not changed: only the recorded mtime needs updating
+        manifest["images"] = old["images"]
+        return [], manifest, len(old["images"])
+
+    # Outputs written with other options are all redone
+    old_images = old["images"] if extractManifest.same_options(old, options) else {}
+    view = memoryview(buffer)
+    tasks = []
+    for task in buffer_tasks(buffer, tpl_path, output_dir, options):
+        palette = None
+        if task.palette:
+            palette_addr, palette_length, palette_format = task.palette
+            palette = (view[palette_addr:palette_addr + palette_length], palette_format)
+        variant, ext = output_kind(task.format_str, palette, options)
+        name = os.path.basename(output_path(task.img_index, output_dir, task.level, ext))
+        key = decodeCache.image_key(view[task.data_addr:task.data_addr + task.length],
+                                    task.format_str, task.height, task.width, palette, variant)
+        manifest["images"][name] = key
+        if old_images.get(name) != key or not os.path.exists(os.path.join(output_dir, name)):
+            tasks.append(task)
+    return tasks, manifest, len(manifest["images"]) - len(tasks)
+
+def write_manifests(manifests, tasks, failed):
+    """
+    Write the manifests from incremental_tasks (keyed by output dir) once
+    tasks have run, leaving out the images that failed so they're retried.
+    """
+    for task_idx in failed:
+        task = tasks[task_idx]
+        manifest = manifests.get(task.output_dir)
+        if manifest:
+            _, ext = output_kind(task.format_str, task.palette, task.options)
+            manifest["images"].pop(os.path.basename(output_path(task.img_index, task.output_dir, task.level, ext)), None)
+    for output_dir, manifest in manifests.items():
+        extractManifest.write_manifest(output_dir, manifest)
+
+def run_tasks(tasks, jobs=None, options=None, profile=None):
+    """
+    Run decode tasks on up to `jobs` worker processes (default: one per
+    core) and report failures in task order. Returns (pixels decoded, set
+    of indices of failed tasks). Output files and messages are the same for
+    any number of jobs. Cache hit/miss counts are printed when the run uses
+    a cache. Per-image profile summaries are added to profile (a
+    profiler.RunProfile) if given.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    for output_dir in {task.output_dir for task in tasks if not task.bundle_slot}:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if jobs <= 1 or len(tasks) <= 1:
+        results = itertools.chain.from_iterable(map(_decode_tasks, task_batches(tasks)))
+        pool = None
+    else:
+        workers = min(jobs, len(tasks))
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker)
+        results = itertools.chain.from_iterable(pool.map(_decode_tasks, task_batches(tasks, workers)))
+
+    pixels = 0
+    decoded = 0
+    hits = 0
+    failed = set()
+    try:
+        for task_idx, (task, (img_index, error, cache_hit, summary)) in enumerate(zip(tasks, results)):
+            if profile and summary:
+                profile.add_image(summary)
+            if error:
+                print(f"Skipping image {img_index} of {task.tpl_file}: {error}")
+                failed.add(task_idx)
+            else:
+                pixels += task.height * task.width
+                decoded += 1
+                hits += cache_hit
+    finally:
+        if pool:
+            pool.shutdown()
+
+    cache = (options or {}).get("cache")
+    if cache:
+        evicted = cache.evict()
+        print(f"Cache: {hits} hits, {decoded - hits} misses, {evicted} entries evicted")
+    return pixels, failed
+
+def decode_bundle(tasks, output_root="tex", jobs=None, options=None, profile=None):
+    """
+    Decode tasks into a single memory-mappable RGBA blob (output_root/bundle.rgba)
+    plus a JSON index (bundle.json) of name, offset, shape, format and sampler
+    parameters per image; see bundle.open_bundle. Names are the output paths
+    the images would otherwise get, relative to output_root, without extension.
+    Returns the number of pixels decoded.
+    """
+    blob_path = os.path.join(output_root, "bundle.rgba")
+    offsets, size = bundle.layout([(task.height, task.width, 4) for task in tasks])
+    bundle.create_blob(blob_path, size)
+    tasks = [task._replace(bundle_slot=(os.path.abspath(blob_path), offset)) for task, offset in zip(tasks, offsets)]
+
+    pixels, failed = run_tasks(tasks, jobs, options, profile)
+
+    # Sampler parameters come from the image headers, parsed once per file
+    headers = {}
+    entries = []
+    for task_idx, task in enumerate(tasks):
+        if task_idx in failed:
+            continue
+        if task.tpl_file not in headers:
+            with open(task.tpl_file, "rb") as file:
+                headers[task.tpl_file] = imageStream.parse_tpl(imageStream.map_tpl(file))
+        header = headers[task.tpl_file][task.img_index - 1]
+
+        name = os.path.relpath(output_path(task.img_index, task.output_dir, task.level, ""), output_root)
+        entry = {
+            "name": name.replace(os.sep, "/"),
+            "offset": task.bundle_slot[1],
+            "shape": [task.height, task.width, 4],
+            "format": task.format_str,
+            "level": task.level,
+        }
+        entry.update({field: getattr(header, field) for field in bundle.SAMPLER_FIELDS})
+        entries.append(entry)
+    headers.clear()
+
+    bundle.write_index(blob_path, entries)
+    return pixels
+
+def run_profile(options):
+    """
+    A profiler.RunProfile if the run is profiled (options["profile"] is the
+    report path), else None.
+    """
+    return profiler.RunProfile() if (options or {}).get("profile") else None
+
+def decode_tpl(tpl_file, output_dir="tex", jobs=None, options=None):
+    """
+    Decode every image of a TPL file into output_dir. Images unchanged since
+    the last extraction into output_dir are skipped (see incremental_tasks),
+    except in bundle mode.
+    """
+    profile = run_profile(options)
+    as_bundle = (options or {}).get("bundle")
+    with profiler.span(profile, "parse"):
+        if as_bundle:
+            tasks = tpl_tasks(tpl_file, output_dir, options)
+        else:
+            tasks, manifest, unchanged = incremental_tasks(tpl_file, output_dir, options)
+    with profiler.span(profile, "run"):
+        if as_bundle:
+            decode_bundle(tasks, output_dir, jobs, options, profile)
+        else:
+            _, failed = run_tasks(tasks, jobs, options, profile)
+            if manifest:
+                write_manifests({output_dir: manifest}, tasks, failed)
+            if unchanged:
+                print(f"{unchanged} unchanged images skipped")
+    if profile:
+        profile.write(options["profile"])
+
+def decode_batch(path, output_root="tex", jobs=None, options=None):
+    """
+    Decode every TPL found under a directory (or matching a glob) on one
+    shared pool. Each file gets its own folder under output_root, mirroring
+    its path relative to the search root.
+    """
+    start = time.perf_counter()
+    profile = run_profile(options)
+    with profiler.span(profile, "scan"):
+        tpl_files, root = imageStream.find_tpl_files(path)
+
+    as_bundle = (options or {}).get("bundle")
+    tasks = []
+    manifests = {}
+    n_files = 0
+    unchanged = 0
+    with profiler.span(profile, "parse"):
+        for tpl_file in tpl_files:
+            output_dir = os.path.join(output_root, os.path.relpath(tpl_file, root))
+            try:
+                if as_bundle:
+                    tasks.extend(tpl_tasks(tpl_file, output_dir, options))
+                else:
+                    file_tasks, manifest, skipped = incremental_tasks(tpl_file, output_dir, options)
+                    tasks.extend(file_tasks)
+                    unchanged += skipped
+                    if manifest:
+                        manifests[output_dir] = manifest
+            except ValueError as e:
+                print(f"Skipping {tpl_file}: {e}")
+                continue
+            n_files += 1
+
+    with profiler.span(profile, "run"):
+        if as_bundle:
+            pixels = decode_bundle(tasks, output_root, jobs, options, profile)
+        else:
+            pixels, failed = run_tasks(tasks, jobs, options, profile)
+            write_manifests(manifests, tasks, failed)
+    if profile:
+        profile.write(options["profile"])
+
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"Decoded {len(tasks)} images from {n_files} files in {elapsed:.2f}s "
+          f"({n_files / elapsed:.1f} files/s, {pixels / 1e6 / elapsed:.2f} MPix/s)"
+          + (f", {unchanged} unchanged images skipped" if unchanged else ""))
 
 # Main script
 if __name__ == "__main__":
-    directory = os.path.dirname(os.path.realpath(__file__))
-    files = os.listdir(directory)
-
-    for filename in files:
-        if filename.startswith('i') and filename.count('_') == 3:
-            parts = filename.split('_')
-            if len(parts) == 4:
-                img_index = int(parts[0][1:])
-                height = int(parts[1])
-                width = int(parts[2])
-                format_str = parts[3]
-
-                if format_str in FORMATS:
-                    decode_func = get_format_function(format_str)
-                    
-                    if decode_func:
-                        file_path = os.path.join(directory, filename)
-                        filesToDelete.append(file_path)
-                        with open(file_path, "rb") as file:
-                            decode_func(file, height, width)
-                    else:
-                        print(f"No decoder function available for format {format_str}.")
-                else:
-                    print(f"Invalid format {format_str} found in {filename}.")
-    for f in filesToDelete:
-        try:
-            os.remove(f)
-        except OSError as e:
-            print(f"Warning: Could not delete {f}: {e}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Decode every image of a TPL file (or of every TPL in a directory/glob) into tex/ as PNGs.")
+    parser.add_argument("tpl_file", type=str, help="The TPL file, directory or glob to decode images from.")
+    imageStream.add_extract_arguments(parser)
+    args = parser.parse_args()
+    options = imageStream.extract_options(args)
+
+    if imageStream.is_batch_path(args.tpl_file):
+        decode_batch(args.tpl_file, jobs=args.jobs, options=options)
+        sys.exit(0)
+
+    if not os.path.exists(args.tpl_file):
+        print(f"Error: The file {args.tpl_file} does not exist.")
+        sys.exit(1)
+
+    decode_tpl(args.tpl_file, jobs=args.jobs, options=options)
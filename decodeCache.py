@@ -0,0 +1,110 @@
+import os
+import shutil
+import threading
+import hashlib
+
+# Default cache location and size limit
+DEFAULT_CACHE_DIR = ".tplcache"
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024  # 1 GiB
+
+def image_key(image_data, format_str, height, width, palette=None, variant=""):
+    """
+    Content hash for one image. palette is (palette_data, palette_format)
+    for indexed images; variant tells apart different output encodings
+    of the same pixels.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{format_str}_{height}_{width}_{variant}_".encode())
+    h.update(image_data)
+    if palette:
+        palette_data, palette_format = palette
+        h.update(f"_{palette_format}_".encode())
+        h.update(palette_data)
+    return h.hexdigest()
+
+class DecodeCache:
+    """
+    On-disk cache of decoded PNGs (or other output files), keyed by a hash of the raw image bytes
+    plus format, width and height, so identical textures shared by several
+    TPLs (or unchanged between runs) are only decoded once.
+
+    Entries are copied out rather than hardlinked, so an output can be
+    edited or deleted without touching the cache. Each entry's mtime is its
+    last use; evict() drops the least recently used entries once the cache
+    grows past max_bytes. The object only holds settings, so it can be
+    handed to pool workers.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def key(self, image_data, format_str, height, width, palette=None, variant=""):
+        return image_key(image_data, format_str, height, width, palette, variant)
+
+    def path(self, key, ext=".png"):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def fetch(self, key, output_path):
+        """
+        Copy the cached file for key to output_path (entries are stored with
+        the output's extension). Returns False on a miss.
+        """
+        entry = self.path(key, os.path.splitext(output_path)[1])
+        try:
+            shutil.copyfile(entry, output_path)
+        except FileNotFoundError:
+            return False
+        # mark as recently used (it may have just been evicted by another process)
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, output_path):
+        """
+        Add a freshly written output file to the cache. The entry is written under a
+        temporary name and renamed, so concurrent workers never see half a file.
+        The name is unique per process and thread, as saves run on threads too.
+        """
+        entry = self.path(key, os.path.splitext(output_path)[1])
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, entry)
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_bytes.
+        Returns the number of entries removed.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+
+        entries = []
+        total = 0
+        for dirpath, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                entry = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(entry)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry))
+                total += st.st_size
+
+        removed = 0
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import itertools
+import concurrent.futures
+
+import imageStream
+
+# Long-lived decode worker: one Python process that takes extraction jobs on
+# stdin and streams results back on stdout, so a caller (main.js) pays the
+# interpreter start, the NumPy/Pillow imports and the Pillow check once
+# instead of once per model.
+#
+# Every message, both ways, is a frame: a 4-byte big-endian length followed
+# by that many bytes, normally a UTF-8 JSON object.
+#
+# Requests:
+#   {"id": 1, "path": "model.tpl", "output_dir": "tex", "options": {...}}
+#   {"id": 2, "bytes": true, ...}  followed by one raw frame with the TPL file
+# options uses the extract options' names from the command line (png_palette,
+# mips, dds, stream, force, cache, cache_size, png_compress_level, png_optimize,
+# png_threads, backend); output_dir defaults to "tex".
+# Path jobs skip images unchanged since the last run into output_dir, like
+# decode.decode_tpl. Closing stdin (or an empty frame) stops the worker.
+#
+# Responses:
+#   {"type": "ready", "pid": ...}  once, at startup
+#   {"type": "image", "id", "image", "level", "path", "cache_hit"}  per image
+#     (with "error" instead of "path" when it couldn't be decoded)
+#   {"type": "done", "id", "images", "failed", "unchanged", "seconds"}  per job
+#   {"type": "error", "id", "error"}  when a job can't be run at all
+
+JOB_OPTIONS = ("png_palette", "mips", "dds", "stream", "force", "cache", "cache_size",
+               "png_compress_level", "png_optimize", "png_threads", "backend")
+
+def read_frame(stream):
+    """
+    Read one frame's payload, or None at end of stream.
+    """
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack(">I", header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return payload
+
+def write_frame(stream, payload):
+    stream.write(struct.pack(">I", len(payload)) + payload)
+    stream.flush()
+
+def send(stream, message):
+    write_frame(stream, json.dumps(message).encode("utf-8"))
+
+class JobOptionParser(argparse.ArgumentParser):
+    # Bad options fail the job instead of exiting the worker
+    def error(self, message):
+        raise ValueError(f"Invalid options: {message}")
+
+def job_options(requested):
+    """
+    Turn a job's "options" object into the options dict decode.py takes.
+    The options are turned back into command line arguments and parsed by
+    the command line's own parser, so they're checked (types, choices) and
+    defaulted exactly like imageStream.py's.
+    """
+    unknown = set(requested) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unsupported options: {', '.join(sorted(unknown))}")
+    parser = JobOptionParser()
+    imageStream.add_extract_arguments(parser)
+    defaults = vars(parser.parse_args([]))
+
+    argv = []
+    for name, value in requested.items():
+        flag = "--" + name.replace("_", "-")
+        if isinstance(defaults[name], bool):
+            # On/off switches: only a JSON true or false
+            if not isinstance(value, bool):
+                raise ValueError(f"Invalid options: {name} must be true or false, not {value!r}")
+            if value:
+                argv.append(flag)
+        elif value is None or value is False:
+            continue
+        elif value is True:
+            # --cache without a directory
+            argv.append(flag)
+        elif name == "mips" and isinstance(value, list):
+            argv += [flag, ",".join(str(level) for level in value)]
+        else:
+            argv += [flag, str(value)]
+    args = parser.parse_args(argv)
+    try:
+        return imageStream.extract_options(args)
+    except ValueError as e:
+        # e.g. mips that aren't numbers
+        raise ValueError(f"Invalid options: {e}")
+
+def run_job(request, data, pool, out, jobs=1):
+    """
+    Decode one job's images, streaming "image" messages (one per task, sent
+    a batch at a time once the batch's files are written) and a final
+    "done" message. data is the TPL's bytes for "bytes" requests; those are
+    decoded in this process, path requests go to the pool of jobs workers.
+    """
+    import decode
+
+    start = time.perf_counter()
+    job_id = request.get("id")
+    output_dir = request.get("output_dir", "tex")
+    options = job_options(request.get("options") or {})
+
+    manifest = None
+    unchanged = 0
+    if data is not None:
+        tasks = decode.buffer_tasks(data, "<bytes>", output_dir, options)
+        results = decode.run_batch(tasks, data)
+    else:
+        tpl_file = request["path"]
+        if not os.path.isfile(tpl_file):
+            raise ValueError(f"The file {tpl_file} does not exist.")
+        tasks, manifest, unchanged = decode.incremental_tasks(tpl_file, output_dir, options)
+        batches = decode.task_batches(tasks, jobs)
+        results = itertools.chain.from_iterable(pool.map(decode._decode_tasks, batches) if pool
+                                                else map(decode._decode_tasks, batches))
+    if tasks:
+        os.makedirs(output_dir, exist_ok=True)
+
+    failed = set()
+    for task_idx, (task, (img_index, error, cache_hit, _)) in enumerate(zip(tasks, results)):
+        message = {"type": "image", "id": job_id, "image": img_index, "level": task.level}
+        if error:
+            message["error"] = error
+            failed.add(task_idx)
+        else:
+            _, ext = decode.output_kind(task.format_str, task.palette, options)
+            message["path"] = decode.output_path(img_index, output_dir, task.level, ext)
+            message["cache_hit"] = cache_hit
+        send(out, message)
+
+    if manifest:
+        decode.write_manifests({output_dir: manifest}, tasks, failed)
+    if options.get("cache"):
+        options["cache"].evict()
+    send(out, {"type": "done", "id": job_id, "images": len(tasks), "failed": len(failed), "unchanged": unchanged,
+               "seconds": time.perf_counter() - start})
+
+def serve(jobs=None, stdin=None, stdout=None):
+    """
+    Answer job requests from stdin until it's closed. jobs worker processes
+    (default: one per core) are started once and kept for every job.
+    """
+    stdin = stdin or sys.stdin.buffer
+    if stdout is None:
+        # Anything printed along the way must not end up between frames, including
+        # the output of child processes (ensure_pillow's pip), which inherit fd 1:
+        # frames go to a copy of the real stdout and fd 1 becomes stderr
+        sys.stdout.flush()
+        out = os.fdopen(os.dup(1), "wb")
+        os.dup2(2, 1)
+    else:
+        out = stdout
+    sys.stdout = sys.stderr
+
+    # Pay for the Pillow check and the NumPy/Pillow imports before the first job
+    imageStream.ensure_pillow()
+    import decode  # noqa: F401
+
+    jobs = jobs or os.cpu_count() or 1
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=decode._init_pool_worker) if jobs > 1 else None
+    try:
+        send(out, {"type": "ready", "pid": os.getpid()})
+        while True:
+            payload = read_frame(stdin)
+            if not payload:
+                break
+            request = {}
+            try:
+                request = json.loads(payload)
+                data = None
+                if request.get("bytes"):
+                    data = read_frame(stdin)
+                    if data is None:
+                        break
+                run_job(request, data, pool, out, jobs)
+            except Exception as e:
+                send(out, {"type": "error", "id": request.get("id"), "error": str(e)})
+    finally:
+        if pool:
+            pool.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode TPL files for jobs sent as length-prefixed JSON on stdin, streaming results to stdout.")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of worker processes used to decode (default: number of cores).")
+    args = parser.parse_args()
+    serve(args.jobs)
@@ -0,0 +1,131 @@
+import os
+import json
+import math
+import time
+import platform
+import importlib.metadata
+import numpy as np
+
+# Per-machine timings behind decode's adaptive dispatch. calibrate() times
+# every registered implementation of every format (decode.DECODERS) on
+# random data at a few sizes and records the fastest; decode.select_decoder
+# then picks, for each image, the one that won at the nearest calibrated
+# size. Results are stored per machine fingerprint (host, CPU, core count
+# and library versions) in one JSON file, so a home directory shared by
+# several machines keeps each one's numbers, and upgrading NumPy or Numba
+# calls for a new calibration instead of silently reusing stale ones.
+#   python benchmark.py --calibrate
+#
+#   {"version": 1, "machines": {fingerprint: {"created": unix time, "formats": {
+#       format: [{"width", "height", "pixels", "fastest", "seconds": {name: best time}}, ...]}}}}
+
+DEFAULT_CALIBRATION = os.path.join(os.path.expanduser("~"), ".tplcalibration.json")
+CALIBRATION_VERSION = 1
+CALIBRATION_SIZES = [(8, 8), (32, 32), (128, 128), (512, 512), (1024, 1024)]
+
+# Each implementation runs for at least this long (and at least twice); its fastest run counts
+MIN_CALIBRATION_SECONDS = 0.05
+
+def fingerprint():
+    # Numba's version from its package metadata: importing it here would cost
+    # every run that reads the calibration the few hundred ms decode avoids
+    try:
+        numba_version = importlib.metadata.version("numba")
+    except importlib.metadata.PackageNotFoundError:
+        numba_version = "none"
+    return "|".join([platform.node(), platform.machine(), platform.processor() or "?", f"{os.cpu_count()} cores",
+                     f"python {platform.python_version()}", f"numpy {np.__version__}", f"numba {numba_version}"])
+
+def load(path=DEFAULT_CALIBRATION):
+    """
+    This machine's calibrated formats ({format: [entry, ...]}), or None if
+    it hasn't been calibrated.
+    """
+    try:
+        with open(path, "r") as f:
+            calibration = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(calibration, dict) or calibration.get("version") != CALIBRATION_VERSION:
+        return None
+    machine = calibration.get("machines", {}).get(fingerprint())
+    return machine.get("formats") if machine else None
+
+def save(formats, path=DEFAULT_CALIBRATION):
+    calibration = None
+    try:
+        with open(path, "r") as f:
+            calibration = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if not isinstance(calibration, dict) or calibration.get("version") != CALIBRATION_VERSION:
+        calibration = {"version": CALIBRATION_VERSION, "machines": {}}
+    calibration["machines"][fingerprint()] = {"created": time.time(), "formats": formats}
+    # Written to a temporary name first, so concurrent readers never see half a file
+    with open(path + ".tmp", "w") as f:
+        json.dump(calibration, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    _loaded.pop(path, None)
+
+# Calibrations read by this process, by path; loaded on first use
+_loaded = {}
+
+def fastest(format_str, pixels, path=DEFAULT_CALIBRATION):
+    """
+    Name of the implementation calibrated fastest for format_str at the
+    calibrated size nearest to pixels (on a log scale), or None without a
+    calibration for it.
+    """
+    if path not in _loaded:
+        _loaded[path] = load(path)
+    entries = (_loaded[path] or {}).get(format_str)
+    if not entries:
+        return None
+    nearest = min(entries, key=lambda entry: abs(math.log(max(pixels, 1)) - math.log(entry["pixels"])))
+    return nearest["fastest"]
+
+def best_time(func):
+    best = float("inf")
+    runs = 0
+    start = time.perf_counter()
+    while runs < 2 or time.perf_counter() - start < MIN_CALIBRATION_SECONDS:
+        run_start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - run_start)
+        runs += 1
+    return best
+
+def calibrate(formats=None, sizes=CALIBRATION_SIZES, path=DEFAULT_CALIBRATION, seed=0):
+    """
+    Time every candidate implementation (decode.candidate_decoders) of each
+    format at each (width, height) on random data, store the results for
+    this machine in path and return them. An implementation whose output
+    differs from numpy's is reported and left out.
+    """
+    import decode
+    import imageStream
+
+    rng = np.random.default_rng(seed)
+    results = {}
+    for format_str in formats or list(decode.DECODERS):
+        entries = []
+        for width, height in sizes:
+            raw = rng.integers(0, 256, imageStream.image_size(imageStream.FORMAT_IDS[format_str], width, height), dtype=np.uint8).tobytes()
+            args = (raw, height, width)
+            if format_str in imageStream.PALETTED_FORMATS:
+                args += (decode.decode_palette(rng.integers(0, 256, 2 * 4096, dtype=np.uint8).tobytes(), 'RGB5A3'),)
+
+            expected = decode.DECODERS[format_str]["numpy"].func(*args)
+            seconds = {}
+            for decoder in decode.candidate_decoders(format_str, height, width, parallel=True):
+                # The first call also pays for any JIT compilation, so it isn't timed
+                output = decoder.func(*args)
+                if output.shape != expected.shape or not np.array_equal(output, expected):
+                    print(f"{decoder.name} {format_str} decoder output differs from numpy's at {width}x{height}; skipped")
+                    continue
+                seconds[decoder.name] = best_time(lambda: decoder.func(*args))
+            entries.append({"width": width, "height": height, "pixels": width * height,
+                            "fastest": min(seconds, key=seconds.get), "seconds": seconds})
+        results[format_str] = entries
+    save(results, path)
+    return results
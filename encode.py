@@ -0,0 +1,372 @@
+import os
+import sys
+import struct
+import argparse
+import numpy as np
+from PIL import Image
+
+import imageStream
+import decode
+
+# Encoders mirroring decode.py's decoders: each takes a (H,W,4) uint8 RGBA
+# array and returns the image's tiled bytes, which decode back to the
+# nearest colors the format can hold (and to exactly the same pixels for
+# images that were decoded from that format in the first place).
+
+ENCODE_FORMATS = ('I8', 'IA8', 'RGB565', 'RGB5A3', 'CMPR')
+
+# Data of every image (and mip level) starts on a 32-byte boundary, as GX expects
+TPL_DATA_ALIGN = 32
+
+# Header fields written for every image unless overridden (see encode_tpl)
+DEFAULT_SAMPLER = {
+    "wrap_s": 0,          # clamp
+    "wrap_t": 0,
+    "min_filter": 1,      # linear
+    "mag_filter": 1,
+    "lod_bias": 0.0,
+    "edge_lod_enable": 0,
+}
+
+# -----------------------------------------------------------------------------
+#                           HELPER FUNCTIONS
+# -----------------------------------------------------------------------------
+
+def load_png(path):
+    """
+    Load any image Pillow can open as a (H,W,4) RGBA array.
+    """
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGBA"))
+
+def swizzle(pixels, tile_w, tile_h):
+    """
+    Inverse of decode.deswizzle: reorder a linear (H,W,...) image into tile
+    order, padding partial tiles by repeating the last row/column.
+    Returns an array indexed by pixel in file order on its first axis.
+    """
+    height, width = pixels.shape[:2]
+    tiles_x = (width  + tile_w - 1) // tile_w
+    tiles_y = (height + tile_h - 1) // tile_h
+    pad = [(0, tiles_y * tile_h - height), (0, tiles_x * tile_w - width)] + [(0, 0)] * (pixels.ndim - 2)
+    padded = np.pad(pixels, pad, mode="edge")
+    tail = pixels.shape[2:]
+    tiles = padded.reshape((tiles_y, tile_h, tiles_x, tile_w) + tail).swapaxes(1, 2)
+    return tiles.reshape((-1,) + tail)
+
+# Nearest n-bit level of 8-bit values expanded the way decode.py does
+# ((v * 255) // max for 5/6 bits, v * 17 for 4 bits)
+def quantize(value, bits):
+    top = (1 << bits) - 1
+    return (np.asarray(value, dtype=np.uint32) * top + 127) // 255
+
+def intensity(image):
+    """
+    Luma of an RGBA image; grey pixels keep their exact value.
+    """
+    rgb = image[..., :3].astype(np.uint32)
+    return ((77 * rgb[..., 0] + 150 * rgb[..., 1] + 29 * rgb[..., 2] + 128) >> 8).astype(np.uint8)
+
+def rgb_to_rgb565(rgb):
+    """
+    Pack (...,3) RGB into 16-bit RGB565 values.
+    """
+    r = quantize(rgb[..., 0], 5)
+    g = quantize(rgb[..., 1], 6)
+    b = quantize(rgb[..., 2], 5)
+    return ((r << 11) | (g << 5) | b).astype(np.uint16)
+
+# ================================ I8 COMPRESSION ==============================
+def encode_I8(image):
+    """
+    I8 => 8 bits/pixel in 8×4 tiles; alpha is dropped.
+    """
+    return swizzle(intensity(image), 8, 4).tobytes()
+
+# ================================ IA8 COMPRESSION =============================
+def encode_IA8(image):
+    """
+    IA8 => 16 bits/pixel in 4×4 tiles, alpha byte first.
+    """
+    pixels = np.stack((image[..., 3], intensity(image)), axis=-1)
+    return swizzle(pixels, 4, 4).tobytes()
+
+# ================================ RGB565 COMPRESSION ==========================
+def encode_RGB565(image):
+    """
+    RGB565 => 16 bits/pixel (big-endian) in 4×4 tiles; alpha is dropped.
+    """
+    return swizzle(rgb_to_rgb565(image), 4, 4).astype('>u2').tobytes()
+
+# ================================ RGB5A3 COMPRESSION ==========================
+def encode_RGB5A3(image):
+    """
+    RGB5A3 => 16 bits/pixel in 4×4 tiles, the mode chosen per pixel:
+    opaque-looking pixels get RGB555 (top bit set), the rest ARGB with
+    4-bit color and the alpha levels decode_RGB5A3 expands (a * 17, a < 8).
+    """
+    rgba = image.astype(np.uint32)
+    alpha = np.minimum((rgba[..., 3] + 8) // 17, 7)
+    # Past the halfway point between the largest translucent alpha (7 * 17) and 255
+    opaque = rgba[..., 3] >= (7 * 17 + 255 + 1) // 2
+
+    rgb555 = 0x8000 | (quantize(rgba[..., 0], 5) << 10) | (quantize(rgba[..., 1], 5) << 5) | quantize(rgba[..., 2], 5)
+    argb3444 = (alpha << 12) | (quantize(rgba[..., 0], 4) << 8) | (quantize(rgba[..., 1], 4) << 4) | quantize(rgba[..., 2], 4)
+    val = np.where(opaque, rgb555, argb3444)
+    return swizzle(val, 4, 4).astype('>u2').tobytes()
+
+# ================================ CMPR COMPRESSION ============================
+CMPR_PRESETS = ('fast', 'quality')
+
+# Alpha below this makes a texel transparent (CMPR has 1-bit alpha)
+CMPR_ALPHA_THRESHOLD = 128
+
+def cmpr_blocks(image):
+    """
+    Split an image into CMPR's 4x4 sub-blocks in file order (four per 8x8
+    macro-block, 2x2 within it). Returns (N,16,4) texels, rows first.
+    """
+    height, width = image.shape[:2]
+    blocks_wide = (width  + 7) // 8
+    blocks_high = (height + 7) // 8
+    padded = np.pad(image, [(0, blocks_high * 8 - height), (0, blocks_wide * 8 - width), (0, 0)], mode="edge")
+    # (by, sub_y, row, bx, sub_x, col) => (by, bx, sub_y, sub_x, row, col), the inverse of decode_CMPR
+    texels = padded.reshape(blocks_high, 2, 4, blocks_wide, 2, 4, 4).transpose(0, 3, 1, 4, 2, 5, 6)
+    return texels.reshape(-1, 16, 4)
+
+def cmpr_endpoints_bbox(rgb, weights):
+    """
+    Fast endpoints: corners of each block's RGB bounding box (over the
+    texels with weight 1).
+    """
+    big = np.where(weights[..., None], rgb, -1.0)
+    small = np.where(weights[..., None], rgb, 256.0)
+    return big.max(axis=1), small.min(axis=1)
+
+def cmpr_endpoints_pca(rgb, weights):
+    """
+    Quality endpoints: extremes of each block's texels along its principal
+    color axis (a few power iterations on the color covariance).
+    """
+    count = np.maximum(weights.sum(axis=1, keepdims=True), 1)
+    mean = (rgb * weights[..., None]).sum(axis=1) / count
+    centered = (rgb - mean[:, None]) * weights[..., None]
+    cov = np.einsum('nki,nkj->nij', centered, centered)
+
+    axis = cov.sum(axis=2) + 1e-6  # row sums are a decent start for the dominant eigenvector
+    for _ in range(8):
+        axis = np.einsum('nij,nj->ni', cov, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-12)
+
+    proj = np.einsum('nki,ni->nk', rgb - mean[:, None], axis)
+    high = np.where(weights, proj, -np.inf).max(axis=1)
+    low = np.where(weights, proj, np.inf).min(axis=1)
+    high = np.where(np.isfinite(high), high, 0)
+    low = np.where(np.isfinite(low), low, 0)
+    return mean + high[:, None] * axis, mean + low[:, None] * axis
+
+def cmpr_pick(rgb, transparent, end0, end1):
+    """
+    Quantize endpoints to RGB565 and choose every texel's index against the
+    palette decode_CMPR will build from them. Blocks with transparent
+    texels use the 3-color mode (c0 <= c1, index 3 transparent), the rest
+    the 4-color mode (c0 > c1). Returns (c0, c1, indices, error per block).
+    """
+    has_alpha = transparent.any(axis=1)
+    e0 = rgb_to_rgb565(np.clip(np.rint(end0), 0, 255).astype(np.uint8))
+    e1 = rgb_to_rgb565(np.clip(np.rint(end1), 0, 255).astype(np.uint8))
+    c0 = np.where(has_alpha, np.minimum(e0, e1), np.maximum(e0, e1))
+    c1 = np.where(has_alpha, np.maximum(e0, e1), np.minimum(e0, e1))
+
+    palettes = decode.cmpr_palettes(c0, c1)[:, :, :3].astype(np.int32)
+    diff = rgb[:, :, None, :].astype(np.int32) - palettes[:, None, :, :]
+    dist = (diff * diff).sum(axis=3)
+    # Index 3 is transparent in 3-color blocks (c0 <= c1, so also whenever c0 == c1)
+    three_color = (c0 <= c1)[:, None]
+    dist[:, :, 3] = np.where(three_color, np.iinfo(np.int32).max, dist[:, :, 3])
+
+    indices = dist.argmin(axis=2).astype(np.uint8)
+    indices = np.where(transparent, 3, indices)
+    error = np.where(transparent, 0, dist.min(axis=2)).sum(axis=1)
+    return c0, c1, indices, error
+
+def cmpr_refit(rgb, transparent, c0, c1, indices):
+    """
+    Least-squares endpoints for the indices chosen in 4-color blocks
+    (3-color blocks keep their endpoints).
+    """
+    # Weight of endpoint 0 for palette entries 0..3 of a 4-color block
+    w0 = np.array([1.0, 0.0, 2 / 3, 1 / 3])[indices]
+    w1 = 1.0 - w0
+    opaque = ~transparent
+    w0 = w0 * opaque
+    w1 = w1 * opaque
+
+    a = (w0 * w0).sum(axis=1)
+    b = (w0 * w1).sum(axis=1)
+    c = (w1 * w1).sum(axis=1)
+    det = a * c - b * b
+    x0 = (w0[..., None] * rgb).sum(axis=1)
+    x1 = (w1[..., None] * rgb).sum(axis=1)
+    solvable = (np.abs(det) > 1e-9) & (c0 > c1)
+    det = np.where(solvable, det, 1.0)[:, None]
+    end0 = (c[:, None] * x0 - b[:, None] * x1) / det
+    end1 = (a[:, None] * x1 - b[:, None] * x0) / det
+
+    old0 = decode.rgb565_to_rgb(c0).astype(np.float64)
+    old1 = decode.rgb565_to_rgb(c1).astype(np.float64)
+    return np.where(solvable[:, None], end0, old0), np.where(solvable[:, None], end1, old1)
+
+def encode_CMPR(image, preset='fast'):
+    """
+    CMPR (DXT1-like) => 8x8 macro-blocks of four 8-byte 4x4 sub-blocks.
+      fast    => bounding-box endpoints, one index pass
+      quality => principal-axis endpoints plus a least-squares refit, keeping
+                 whichever of bbox / axis / refit gives the least error per block
+    Every sub-block of the image is compressed at once.
+    """
+    if preset not in CMPR_PRESETS:
+        raise ValueError(f"Invalid CMPR preset {preset}.")
+
+    texels = cmpr_blocks(image)
+    rgb = texels[:, :, :3].astype(np.float64)
+    transparent = texels[:, :, 3] < CMPR_ALPHA_THRESHOLD
+    weights = ~transparent
+
+    c0, c1, indices, error = cmpr_pick(rgb, transparent, *cmpr_endpoints_bbox(rgb, weights))
+    if preset == 'quality':
+        candidates = [cmpr_pick(rgb, transparent, *cmpr_endpoints_pca(rgb, weights))]
+        candidates.append(cmpr_pick(rgb, transparent, *cmpr_refit(rgb, transparent, *candidates[0][:3])))
+        for cand_c0, cand_c1, cand_indices, cand_error in candidates:
+            better = cand_error < error
+            c0 = np.where(better, cand_c0, c0)
+            c1 = np.where(better, cand_c1, c1)
+            indices = np.where(better[:, None], cand_indices, indices)
+            error = np.where(better, cand_error, error)
+
+    blocks = np.empty((len(texels), 8), dtype=np.uint8)
+    blocks[:, 0:2] = c0.astype('>u2').view(np.uint8).reshape(-1, 2)
+    blocks[:, 2:4] = c1.astype('>u2').view(np.uint8).reshape(-1, 2)
+    # One byte per row, first texel in the top bits
+    rows = indices.reshape(-1, 4, 4)
+    blocks[:, 4:8] = (rows[..., 0] << 6) | (rows[..., 1] << 4) | (rows[..., 2] << 2) | rows[..., 3]
+    return blocks.tobytes()
+
+# ================================ ================= ==============================
+# ================================ COMPRESSION END ================================
+# ================================ ================= ==============================
+
+def get_encode_function(format_str):
+    """
+    Get the encode function for a given format string.
+    """
+    format_function_map = {
+        'I8': encode_I8,
+        'IA8': encode_IA8,
+        'RGB565': encode_RGB565,
+        'RGB5A3': encode_RGB5A3,
+        'CMPR': encode_CMPR,
+    }
+    return format_function_map.get(format_str)
+
+def encode_image(image, format_str, preset='fast'):
+    """
+    Encode one (H,W,4) RGBA image into the bytes of format_str.
+    preset only applies to CMPR.
+    """
+    encode_func = get_encode_function(format_str)
+    if not encode_func:
+        raise ValueError(f"No encoder function available for format {format_str}.")
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    if image.ndim != 3 or image.shape[2] != 4:
+        raise ValueError(f"Expected a (H,W,4) RGBA image, got shape {image.shape}.")
+    if format_str == 'CMPR':
+        return encode_func(image, preset)
+    return encode_func(image)
+
+def mip_chain(image, levels=None):
+    """
+    The image plus successively halved (2x2 box filtered) mip levels, down
+    to 1x1 or `levels` levels in total.
+    """
+    chain = [image]
+    while (levels is None or len(chain) < levels) and chain[-1].shape[:2] != (1, 1):
+        prev = chain[-1].astype(np.uint16)
+        height, width = prev.shape[:2]
+        prev = np.pad(prev, [(0, height % 2), (0, width % 2), (0, 0)], mode="edge")
+        summed = prev[0::2, 0::2] + prev[1::2, 0::2] + prev[0::2, 1::2] + prev[1::2, 1::2]
+        # Level sizes round down, as image_levels expects
+        summed = summed[:max(1, height // 2), :max(1, width // 2)]
+        chain.append(((summed + 2) // 4).astype(np.uint8))
+    return chain
+
+def encode_tpl(images, preset='fast'):
+    """
+    Build a complete TPL file. images is a list of (levels, format_str,
+    sampler) with levels the (H,W,4) RGBA base image followed by its mip
+    levels (see mip_chain), and sampler a dict overriding DEFAULT_SAMPLER
+    (or None). preset is the CMPR compressor's. A level that can't be
+    encoded raises ValueError. Returns the file's bytes.
+    """
+    header_fmt = ">HHIIIIIIfBBBB"
+    header_size = struct.calcsize(header_fmt)
+    imgtab_off = 0x0C
+    headers_off = imgtab_off + len(images) * 8
+    data_off = headers_off + len(images) * header_size
+
+    table = bytearray()
+    headers = bytearray()
+    data = bytearray()
+    for img_idx, (levels, format_str, sampler) in enumerate(images):
+        settings = dict(DEFAULT_SAMPLER, **(sampler or {}))
+        height, width = levels[0].shape[:2]
+        format_id = imageStream.FORMAT_IDS[format_str]
+
+        data_addr = data_off + len(data)
+        data_addr += -data_addr % TPL_DATA_ALIGN
+        data += bytes(data_addr - data_off - len(data))
+        for level, image in enumerate(levels):
+            expected = (max(1, height >> level), max(1, width >> level))
+            if image.shape[:2] != expected:
+                raise ValueError(f"Mip level {level} of image {img_idx + 1} is {image.shape[1]}x{image.shape[0]}, expected {expected[1]}x{expected[0]}.")
+            data += encode_image(image, format_str, preset)
+            data += bytes(-len(data) % TPL_DATA_ALIGN)
+
+        table += struct.pack(">II", headers_off + img_idx * header_size, 0)
+        headers += struct.pack(header_fmt, height, width, format_id, data_addr,
+                               settings["wrap_s"], settings["wrap_t"], settings["min_filter"], settings["mag_filter"],
+                               settings["lod_bias"], settings["edge_lod_enable"], 0, len(levels) - 1, 0)
+
+    return struct.pack(">III", imageStream.TPL_MAGIC, len(images), imgtab_off) + table + headers + data
+
+def write_tpl(out_name, images, preset='fast'):
+    """
+    Write encode_tpl(images, preset) to out_name.
+    """
+    with open(out_name, "wb") as file:
+        file.write(encode_tpl(images, preset))
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode PNGs (one image each, in order) into a TPL file.")
+    parser.add_argument("tpl_file", type=str, help="The TPL file to write.")
+    parser.add_argument("images", type=str, nargs="+", help="The images to encode.")
+    parser.add_argument("--format", "-f", type=str, default="CMPR", choices=ENCODE_FORMATS, help="Texture format (default: CMPR).")
+    parser.add_argument("--preset", type=str, default="fast", choices=CMPR_PRESETS,
+                        help="CMPR compressor: bounding-box endpoints (fast) or principal axis plus refit (quality).")
+    parser.add_argument("--mips", type=str, default="0", metavar="LEVELS",
+                        help="Extra mip levels to generate per image (a number, or \"all\" down to 1x1).")
+    parser.add_argument("--wrap", type=int, default=DEFAULT_SAMPLER["wrap_s"], help="Wrap mode of both axes (0 clamp, 1 repeat, 2 mirror).")
+    args = parser.parse_args()
+
+    mip_levels = None if args.mips == "all" else int(args.mips) + 1
+    sampler = {"wrap_s": args.wrap, "wrap_t": args.wrap}
+    images = []
+    for path in args.images:
+        if not os.path.exists(path):
+            print(f"Error: The file {path} does not exist.")
+            sys.exit(1)
+        images.append((mip_chain(load_png(path), mip_levels), args.format, sampler))
+
+    write_tpl(args.tpl_file, images, args.preset)
+    print(f"Wrote {len(images)} {args.format} images to {args.tpl_file}")
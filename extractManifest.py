@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+
+import savePipeline
+
+# Per-TPL record of the last extraction, written next to its outputs as
+# <output_dir>/manifest.json:
+#   {"version": 1, "tpl": path, "size": bytes, "mtime_ns": ..., "hash": blake2b of the file,
+#    "options": the settings that shape the outputs, "images": {output file name: image hash}}
+# Image hashes are decodeCache.image_key's. A later run skips the TPL when its
+# size and mtime (or failing that, its hash) match and every output is still
+# there, and otherwise only re-decodes images whose hash changed, so the
+# PNGs of unchanged images are never rewritten. Outputs the previous
+# manifest listed that the new one doesn't (after an option change, or
+# when the TPL lost images) are deleted when it's written.
+# There is one manifest per output directory, describing the last TPL
+# extracted into it: extracting different TPLs into the same directory in
+# turn overwrites each other's images, so each run re-decodes everything.
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+def manifest_path(output_dir):
+    return os.path.join(output_dir, MANIFEST_NAME)
+
+def encoding_signature(options):
+    """
+    The options that change a PNG's bytes without changing its pixels: the
+    encoder settings, and streamed writing (pngWriter instead of Pillow).
+    decode.output_kind folds them into cache and manifest keys.
+    """
+    options = options or {}
+    return {
+        "stream": bool(options.get("stream")),
+        "png_compress_level": options.get("png_compress_level", savePipeline.PNG_COMPRESS_LEVEL),
+        "png_optimize": bool(options.get("png_optimize")),
+    }
+
+def options_signature(options):
+    """
+    The options that change which outputs are written or what they hold,
+    down to their bytes (encoding_signature's and the decoder backend
+    included).
+    """
+    options = options or {}
+    mip_levels = options.get("mip_levels") or []
+    return dict(encoding_signature(options), **{
+        "png_palette": bool(options.get("png_palette")),
+        "dds": bool(options.get("dds")),
+        "mip_levels": mip_levels if mip_levels == "all" else sorted(mip_levels),
+        "backend": options.get("backend") or "auto",
+    })
+
+def file_hash(buffer):
+    return hashlib.blake2b(buffer, digest_size=20).hexdigest()
+
+def new_manifest(tpl_file, stat, tpl_hash, options):
+    return {
+        "version": MANIFEST_VERSION,
+        "tpl": tpl_file,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": tpl_hash,
+        "options": options_signature(options),
+        "images": {},
+    }
+
+def load_manifest(output_dir):
+    """
+    The manifest of output_dir's last extraction, or None if there is no
+    usable one.
+    """
+    try:
+        with open(manifest_path(output_dir), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def write_manifest(output_dir, manifest):
+    old = load_manifest(output_dir)
+    # Written to a temporary name first, so an interrupted run never leaves half a manifest
+    path = manifest_path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    if old:
+        remove_stale(output_dir, set(old.get("images", {})) - set(manifest["images"]))
+
+def remove_stale(output_dir, names):
+    """
+    Delete outputs an earlier manifest of output_dir listed that the current
+    one no longer does.
+    """
+    for name in names:
+        # Manifests only list plain file names; anything else isn't ours to delete
+        if not isinstance(name, str) or name != os.path.basename(name) or name in ("", ".", "..", MANIFEST_NAME):
+            continue
+        try:
+            os.remove(os.path.join(output_dir, name))
+        except FileNotFoundError:
+            pass
+
+def outputs_exist(manifest, output_dir):
+    return all(os.path.exists(os.path.join(output_dir, name)) for name in manifest["images"])
+
+def same_options(manifest, options):
+    """
+    Whether manifest's outputs were written with these options, i.e. its
+    image hashes still say which outputs can be kept.
+    """
+    return manifest is not None and manifest.get("options") == options_signature(options)
+
+def up_to_date(manifest, stat, options, output_dir, tpl_hash=None):
+    """
+    Whether manifest still describes output_dir for a TPL with this stat
+    (or, given tpl_hash, these contents) and these options.
+    """
+    if not same_options(manifest, options):
+        return False
+    if tpl_hash is None:
+        same = manifest.get("size") == stat.st_size and manifest.get("mtime_ns") == stat.st_mtime_ns
+    else:
+        same = manifest.get("hash") == tpl_hash
+    return same and outputs_exist(manifest, output_dir)
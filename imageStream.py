@@ -1,10 +1,15 @@
 import struct
 import os
 import sys
+import mmap
 import subprocess
-import numpy as np
 import argparse
 import tempfile
+import glob
+import collections
+
+import decodeCache
+import savePipeline
 
 # Constants for TPL file format
 TPL_MAGIC = 0x0020AF30
@@ -36,64 +41,287 @@ FORMAT_MAP = {
     IMG_FMT_CMPR: "CMPR"
 }
 
-# Helper function to read and unpack data (always big-endian)
-def read_struct(file, fmt):
+# Format name => format id
+FORMAT_IDS = {name: format for format, name in FORMAT_MAP.items()}
+
+# Color-indexed formats, decoded through the image's palette
+PALETTED_FORMATS = ("C4", "C8", "C14X2")
+
+# Decoder implementations --backend accepts (see decode.select_decoder)
+BACKENDS = ("auto", "numpy", "numba", "numba-parallel")
+
+# Tile layout of each image format: (tile width, tile height, bits per pixel)
+FORMAT_TILES = {
+    IMG_FMT_I4: (8, 8, 4),
+    IMG_FMT_I8: (8, 4, 8),
+    IMG_FMT_IA4: (8, 4, 8),
+    IMG_FMT_IA8: (4, 4, 16),
+    IMG_FMT_RGB565: (4, 4, 16),
+    IMG_FMT_RGB5A3: (4, 4, 16),
+    IMG_FMT_RGBA32: (4, 4, 32),
+    IMG_FMT_C4: (8, 8, 4),
+    IMG_FMT_C8: (8, 4, 8),
+    IMG_FMT_C14X2: (4, 4, 16),
+    IMG_FMT_CMPR: (8, 8, 4),  # 8x8 macro-blocks of four 4x4 sub-blocks
+}
+
+# Palette (TLUT) formats used by C4/C8/C14X2 images
+PAL_FMT_IA8 = 0x00
+PAL_FMT_RGB565 = 0x01
+PAL_FMT_RGB5A3 = 0x02
+
+PALETTE_FORMAT_MAP = {
+    PAL_FMT_IA8: "IA8",
+    PAL_FMT_RGB565: "RGB565",
+    PAL_FMT_RGB5A3: "RGB5A3",
+}
+
+# Helper function to unpack data at an offset of the TPL buffer (always big-endian)
+def read_struct(buffer, offset, fmt):
     size = struct.calcsize(fmt)
-    data = file.read(size)
-    if len(data) != size:
+    if offset + size > len(buffer):
         raise ValueError(f"Failed to read {size} bytes from file.")
-    return struct.unpack(fmt, data)
+    return struct.unpack_from(fmt, buffer, offset)
+
+# Header details are only printed at verbosity >= 1 (-v), keeping batch runs quiet
+VERBOSITY = 0
+
+# Map a whole TPL file into memory once (read-only); image data is sliced from this without copying
+def map_tpl(file):
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
 
 # Function to parse the TPL file header and extract texture information
-def parse_tpl_header(file):
-    magic, n_images, imgtab_off = read_struct(file, ">III")
-    print(f"Magic number: {magic:08x}")
-    print(f"Number of images: {n_images:08x} ({n_images})")
-    print(f"Image table offset: {imgtab_off:08x}")
-    
-    if magic == TPL_MAGIC:
-        print("TPL file format.")
-    elif magic == TPLX_MAGIC:
-        print("TPLx file format.")
-    else:
+def parse_tpl_header(buffer):
+    magic, n_images, imgtab_off = read_struct(buffer, 0, ">III")
+    if magic not in (TPL_MAGIC, TPLX_MAGIC):
         raise ValueError("Invalid TPL magic number.")
+
+    if VERBOSITY >= 1:
+        print(f"Magic number: {magic:08x}")
+        print(f"Number of images: {n_images:08x} ({n_images})")
+        print(f"Image table offset: {imgtab_off:08x}")
+        print("TPL file format." if magic == TPL_MAGIC else "TPLx file format.")
         
     return n_images, imgtab_off
 
 # Function to parse the image header and extract relevant information (Height, Width, Format, etc.)
-def parse_image_header(file, img_offset):
-    file.seek(img_offset)
-    height, width, format, data_addr, wrap_s, wrap_t, min_filter, mag_filter, lod_bias, edge_lod_enable, min_lod, max_lod = read_struct(file, ">HHIIIIIfBBBB")
+def parse_image_header(buffer, img_offset):
+    height, width, format, data_addr, wrap_s, wrap_t, min_filter, mag_filter, lod_bias, edge_lod_enable, min_lod, max_lod, unpacked = read_struct(buffer, img_offset, ">HHIIIIIIfBBBB")
     return height, width, format, data_addr, wrap_s, wrap_t, min_filter, mag_filter, lod_bias, edge_lod_enable, min_lod, max_lod
 
-# Function to get image data for all images
-def get_image_data(file, image_objects, n_images):
-    for img_idx in range(n_images):
-        current_image = image_objects[img_idx]
-        if img_idx + 1 < n_images:
-            next_image = image_objects[img_idx + 1]
-            data_end = next_image["data_addr"]
-        else:
-            file.seek(0, os.SEEK_END)
-            data_end = file.tell()
-
-        data_addr = current_image["data_addr"]
-        file.seek(data_addr)
-        image_data = file.read(data_end - data_addr)
-        current_image["image_data"] = image_data
-
-        format_name = FORMAT_MAP.get(current_image["format"], "UnknownFormat")
-
-        # Save image data as a new file
-        output_filename = f"i-{img_idx + 1 }_{image_objects[img_idx]['height']}_{image_objects[img_idx]['width']}_{format_name}"
-        with open(output_filename, "wb") as raw_file:
-            #print(' '.join(f'{byte:02x}' for byte in image_data))
-            raw_file.write(image_data)
+# Function to compute the exact byte size of one image level from its format and dimensions (None if unknown format)
+def image_size(format, width, height):
+    if format not in FORMAT_TILES:
+        return None
+    tile_w, tile_h, bits_per_pixel = FORMAT_TILES[format]
+    tiles_x = (width  + tile_w - 1) // tile_w
+    tiles_y = (height + tile_h - 1) // tile_h
+    return tiles_x * tiles_y * tile_w * tile_h * bits_per_pixel // 8
 
-# Main function to extract TPL to PNG
-def extract_tpl_to_png(tpl_file):
-    image_objects = []  # List to store image objects
+# Function to list the mip levels stored for an image as (level, data address, size, width, height)
+# Levels 0..max_lod are stored back to back, each half the size of the previous one
+def image_levels(image):
+    levels = []
+    data_addr = image.data_addr
+    width, height = image.width, image.height
+    for level in range(image.max_lod + 1):
+        size = image_size(image.format, width, height)
+        if size is None:
+            break
+        levels.append((level, data_addr, size, width, height))
+        if width == 1 and height == 1:
+            break
+        data_addr += size
+        width, height = max(1, width // 2), max(1, height // 2)
+    return levels
+
+# Function to parse a palette header (Entry count, Format, Data address)
+def parse_palette_header(buffer, palette_offset):
+    n_entries, unpacked, pad, palette_format, palette_addr = read_struct(buffer, palette_offset, ">HBBII")
+    return n_entries, palette_format, palette_addr
+
+# Parsed header of one image (plus its palette header, if any)
+# __slots__ keeps thousands of these small; pixel data is never stored here
+class ImageHeader:
+    __slots__ = ("height", "width", "format", "data_addr", "data_size",
+                 "wrap_s", "wrap_t", "min_filter", "mag_filter", "lod_bias", "edge_lod_enable", "min_lod", "max_lod",
+                 "palette_entries", "palette_format", "palette_addr")
+
+    def __init__(self, height, width, format, data_addr, wrap_s, wrap_t, min_filter, mag_filter, lod_bias, edge_lod_enable, min_lod, max_lod,
+                 palette_entries=0, palette_format=None, palette_addr=None):
+        self.height = height
+        self.width = width
+        self.format = format
+        self.data_addr = data_addr
+        self.data_size = image_size(format, width, height)
+        self.wrap_s = wrap_s
+        self.wrap_t = wrap_t
+        self.min_filter = min_filter
+        self.mag_filter = mag_filter
+        self.lod_bias = lod_bias
+        self.edge_lod_enable = edge_lod_enable
+        self.min_lod = min_lod
+        self.max_lod = max_lod
+        self.palette_entries = palette_entries
+        self.palette_format = palette_format
+        self.palette_addr = palette_addr
+
+    @property
+    def format_name(self):
+        return FORMAT_MAP.get(self.format, "UnknownFormat")
+
+    def __repr__(self):
+        return f"ImageHeader({self.width}x{self.height} {self.format_name} @ {self.data_addr:#x})"
+
+# Function to get one image's base level data (zero-copy memoryview slice of the buffer)
+# Mip levels are listed by image_levels
+def get_image_data(buffer, image):
+    return memoryview(buffer)[image.data_addr:image.data_addr + image.data_size]
+
+# Function to get one image's palette data, 16 bits per entry (None if the image has no palette)
+def get_palette_data(buffer, image):
+    if image.palette_addr is None:
+        return None
+    return memoryview(buffer)[image.palette_addr:image.palette_addr + image.palette_entries * 2]
+
+# Function to parse every image header of a TPL file; no image data is read
+def parse_tpl(buffer):
+    image_headers = []  # List to store image headers
+
+    n_images, imgtab_off = parse_tpl_header(buffer)
+    imgtab_end = imgtab_off + n_images * 8  # 8 bytes per image entry in the table
+    if imgtab_end > len(buffer):
+        raise ValueError(f"Failed to read {n_images * 8} bytes from file.")
+
+    # Unpack the whole image table in one pass
+    image_table = struct.iter_unpack(">2I", memoryview(buffer)[imgtab_off:imgtab_end])
+    for img_idx, (img_offset, palette_offset) in enumerate(image_table):
+        #print(f"Image {img_idx + 1} header: {img_offset:08x}")
+        
+        palette_entries, palette_format, palette_addr = 0, None, None
+        if palette_offset != 0x00000000:
+            palette_entries, palette_format, palette_addr = parse_palette_header(buffer, palette_offset)
+            palette_format = PALETTE_FORMAT_MAP.get(palette_format, "UnknownFormat")
+        
+        image_headers.append(ImageHeader(*parse_image_header(buffer, img_offset), palette_entries, palette_format, palette_addr))
+
+    # Unknown formats have no exact size: take everything up to the next image
+    for img_idx, image in enumerate(image_headers):
+        if image.data_size is None:
+            data_end = image_headers[img_idx + 1].data_addr if img_idx + 1 < n_images else len(buffer)
+            image.data_size = max(0, data_end - image.data_addr)
+    return image_headers
+
+# A TPL file opened for lazy access: headers are parsed up front, images are
+# only decoded when indexed (or iterated), so peak memory stays around one image.
+#   with TPLFile("c_mario-") as tpl:
+#       for img_idx, image in enumerate(tpl): ...   (H,W,4) RGBA arrays
+# cache_size keeps that many recently decoded images around for repeated access.
+class TPLFile:
+    def __init__(self, tpl_file, cache_size=0):
+        with open(tpl_file, "rb") as file:
+            self.buffer = map_tpl(file)
+        self.path = tpl_file
+        self.headers = parse_tpl(self.buffer)
+        self.cache_size = cache_size
+        self._decoded = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.headers)
 
+    def __getitem__(self, img_idx):
+        if img_idx < 0:
+            img_idx += len(self.headers)
+        if not 0 <= img_idx < len(self.headers):
+            raise IndexError("TPL image index out of range")
+
+        image = self._decoded.get(img_idx)
+        if image is not None:
+            self._decoded.move_to_end(img_idx)
+            return image
+
+        image = self.decode(img_idx)
+        if self.cache_size > 0:
+            self._decoded[img_idx] = image
+            while len(self._decoded) > self.cache_size:
+                self._decoded.popitem(last=False)
+        return image
+
+    def __iter__(self):
+        return self.images()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def image_data(self, img_idx):
+        return get_image_data(self.buffer, self.headers[img_idx])
+
+    def palette(self, img_idx):
+        image = self.headers[img_idx]
+        if image.palette_addr is None:
+            return None
+        return get_palette_data(self.buffer, image), image.palette_format
+
+    def decode(self, img_idx):
+        """Decode one image to a (H,W,4) RGBA array, bypassing the cache."""
+        import decode
+        image = self.headers[img_idx]
+        return decode.decode_image(self.image_data(img_idx), image.height, image.width, image.format_name, self.palette(img_idx))
+
+    def region(self, img_idx, x, y, w, h):
+        """Decode just the w x h rectangle at (x, y) of one image (decode.decode_region), not cached."""
+        import decode
+        image = self.headers[img_idx]
+        return decode.decode_region(self.image_data(img_idx), image.height, image.width, image.format_name,
+                                    x, y, w, h, self.palette(img_idx))
+
+    def preview(self, img_idx):
+        """Quarter-scale (H/4,W/4,4) RGBA preview of one image (decode.decode_preview), not cached."""
+        import decode
+        image = self.headers[img_idx]
+        return decode.decode_preview(self.image_data(img_idx), image.height, image.width, image.format_name, self.palette(img_idx))
+
+    def images(self):
+        """Yield the decoded images one at a time."""
+        for img_idx in range(len(self.headers)):
+            yield self[img_idx]
+
+    def close(self):
+        self._decoded.clear()
+        try:
+            self.buffer.close()
+        except BufferError:
+            # Views of the mapping are still alive; it's released once they are dropped
+            pass
+
+# Function to check whether a file is a TPL by its magic number, whatever its name
+def is_tpl_file(path):
+    try:
+        with open(path, "rb") as file:
+            magic = file.read(4)
+    except OSError:
+        return False
+    return len(magic) == 4 and struct.unpack(">I", magic)[0] in (TPL_MAGIC, TPLX_MAGIC)
+
+# A directory or glob pattern selects batch mode instead of a single TPL file
+def is_batch_path(path):
+    return os.path.isdir(path) or any(c in path for c in "*?[")
+
+# Function to find every TPL in a directory tree (or matching a glob); returns (sorted files, search root)
+def find_tpl_files(path):
+    if os.path.isdir(path):
+        root = path
+        candidates = [os.path.join(dirpath, name) for dirpath, _, names in os.walk(path) for name in names]
+    else:
+        candidates = [f for f in glob.glob(path, recursive=True) if os.path.isfile(f)]
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in candidates]) if candidates else "."
+    return sorted(f for f in candidates if is_tpl_file(f)), root
+
+# Install Pillow on first use if it's missing
+def ensure_pillow():
     try:
         from PIL import Image # type: ignore
     except ImportError:
@@ -105,49 +333,78 @@ def extract_tpl_to_png(tpl_file):
             print("PIL (Pillow) has been successfully installed.")
         except Exception as e:
             print(f"Error installing PIL (Pillow): {e}")  
-    
-    with open(tpl_file, "rb") as file:
-        n_images, imgtab_off = parse_tpl_header(file)
-        file.seek(imgtab_off)
-        for img_idx in range(n_images):
-            img_offset, palette_offset = read_struct(file, ">2I")
-            #print(f"Image {img_idx + 1} header: {img_offset:08x}")
-            
-            if palette_offset != 0x00000000:
-                print(f"TODO:  Palette header: {palette_offset:08x}")
-            
-            height, width, format, data_addr, wrap_s, wrap_t, min_filter, mag_filter, lod_bias, edge_lod_enable, min_lod, max_lod = parse_image_header(file, img_offset)
-            
-            image_objects.append({
-                "height": height,
-                "width": width,
-                "format": format,
-                "data_addr": data_addr,
-                "wrap_s": wrap_s,
-                "wrap_t": wrap_t,
-                "min_filter": min_filter,
-                "mag_filter": mag_filter,
-                "lod_bias": lod_bias,
-                "edge_lod_enable": edge_lod_enable,
-                "min_lod": min_lod,
-                "max_lod": max_lod,
-            })
-        
-            file.seek(imgtab_off + (img_idx + 1) * 8)  # 8 bytes per image entry in the table
-        
-        get_image_data(file, image_objects, n_images)
-        
-        subprocess.run(["python", "decode.py"])
+
+# Main function to extract TPL to PNG
+def extract_tpl_to_png(tpl_file, jobs=None, options=None):
+    ensure_pillow()
+
+    # Imported here so the Pillow check above runs first
+    import decode
+
+    if is_batch_path(tpl_file):
+        decode.decode_batch(tpl_file, jobs=jobs, options=options)
+    else:
+        decode.decode_tpl(tpl_file, jobs=jobs, options=options)
+
+# Command line options shared by imageStream.py and decode.py
+def add_extract_arguments(parser):
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of worker processes used to decode (default: number of cores).")
+    parser.add_argument("--cache", nargs="?", const=decodeCache.DEFAULT_CACHE_DIR, default=None, metavar="DIR",
+                        help=f"Reuse PNGs of previously decoded identical images from DIR (default: {decodeCache.DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--cache-size", type=int, default=decodeCache.DEFAULT_CACHE_SIZE // (1024 * 1024), metavar="MB",
+                        help="Size limit of the decode cache; least recently used entries are evicted past it.")
+    parser.add_argument("--png-palette", action="store_true",
+                        help="Save C4/C8 (and small C14X2) images as paletted \"P\" PNGs instead of RGBA.")
+    parser.add_argument("--mips", type=str, default=None, metavar="LEVELS",
+                        help="Also extract these mip levels (comma separated, or \"all\") as i-N_mipL.png.")
+    parser.add_argument("--dds", action="store_true",
+                        help="Write CMPR images (with their mips) as BC1 i-N.dds files without decoding them.")
+    parser.add_argument("--bundle", action="store_true",
+                        help="Write all decoded images into one memory-mappable tex/bundle.rgba with a tex/bundle.json index instead of PNGs.")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-extract every image, even those unchanged since the last run (see tex/manifest.json).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Decode and write PNGs one row of tiles at a time, keeping memory per image bounded for very large textures.")
+    parser.add_argument("--png-compress-level", type=int, default=savePipeline.PNG_COMPRESS_LEVEL, choices=range(10), metavar="0-9",
+                        help=f"zlib level PNGs are written at: lower is faster, higher is smaller (default: {savePipeline.PNG_COMPRESS_LEVEL}).")
+    parser.add_argument("--png-optimize", action="store_true",
+                        help="Write the smallest PNGs Pillow can (slowest).")
+    parser.add_argument("--png-threads", type=int, default=savePipeline.DEFAULT_THREADS, metavar="N",
+                        help="Threads per worker encoding and writing PNGs while the next image decodes "
+                             f"(default: {savePipeline.DEFAULT_THREADS}; 0 saves each image before decoding the next).")
+    parser.add_argument("--backend", type=str, default=None, choices=BACKENDS,
+                        help="Decoder implementation (default: auto, the fastest for each image's format and size per "
+                             "this machine's calibration, see benchmark.py --calibrate; uncalibrated, numba for images "
+                             "of 256x256 and up when installed, else numpy; output is identical).")
+    parser.add_argument("--profile", type=str, default=None, metavar="FILE",
+                        help="Write per-stage/per-image timings, bytes read/written and peak memory to FILE "
+                             "(Chrome trace-event JSON, loadable in chrome://tracing or Perfetto).")
+    parser.add_argument("--verbose", "-v", action="count", default=0, help="Print TPL header details.")
+
+# Build the per-run options dict handed to decode.py from parsed arguments
+def extract_options(args):
+    global VERBOSITY
+    VERBOSITY = args.verbose
+    options = {"png_palette": args.png_palette, "dds": args.dds, "bundle": args.bundle,
+               "stream": args.stream, "force": args.force, "profile": args.profile,
+               "png_compress_level": args.png_compress_level, "png_optimize": args.png_optimize,
+               "png_threads": args.png_threads, "backend": args.backend}
+    if args.mips:
+        options["mip_levels"] = "all" if args.mips == "all" else [int(level) for level in args.mips.split(",")]
+    if args.cache:
+        options["cache"] = decodeCache.DecodeCache(args.cache, args.cache_size * 1024 * 1024)
+    return options
 
 # Script execution with argparse
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract images from a TPL file and save as PNGs.")
-    parser.add_argument("tpl_file", type=str, help="The TPL file to extract images from.")
+    parser = argparse.ArgumentParser(description="Extract images from a TPL file (or every TPL in a directory/glob) and save as PNGs.")
+    parser.add_argument("tpl_file", type=str, help="The TPL file, directory or glob to extract images from.")
+    add_extract_arguments(parser)
     args = parser.parse_args()
 
     tpl_file = args.tpl_file
-    if not os.path.exists(tpl_file):
+    if not is_batch_path(tpl_file) and not os.path.exists(tpl_file):
         print(f"Error: The file {tpl_file} does not exist.")
         sys.exit(1)
 
-    extract_tpl_to_png(tpl_file)
+    extract_tpl_to_png(tpl_file, jobs=args.jobs, options=extract_options(args))
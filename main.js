@@ -5,40 +5,147 @@ const fs = require('fs');
 const path = require('path');
 const agb = require('./agb');
 
+/**
+ * Client for decodeWorker.py: one Python process, started on first use and
+ * kept warm, that extracts the textures of any number of models.
+ * Messages both ways are 4-byte big-endian length-prefixed JSON frames.
+ */
+class DecodeWorker {
+    constructor() {
+        this.process = null;
+        this.nextId = 1;
+        this.pending = new Map();
+        this.buffer = Buffer.alloc(0);
+    }
+
+    start() {
+        const pythonScript = path.join(__dirname, 'decodeWorker.py');
+        this.process = spawn('py', [pythonScript]);
+
+        this.process.stdout.on('data', (data) => {
+            this.buffer = Buffer.concat([this.buffer, data]);
+            while (this.buffer.length >= 4) {
+                const length = this.buffer.readUInt32BE(0);
+                if (this.buffer.length < 4 + length) {
+                    break;
+                }
+                const message = JSON.parse(this.buffer.subarray(4, 4 + length).toString('utf8'));
+                this.buffer = this.buffer.subarray(4 + length);
+                this.handle(message);
+            }
+        });
+
+        this.process.stderr.on('data', (data) => {
+            console.error(`decodeWorker.py: ${data}`);
+        });
+
+        // A missing Python, or a write after the worker died (EPIPE), fails the
+        // pending jobs instead of throwing
+        this.process.on('error', (error) => {
+            this.failAll(new Error(`decodeWorker.py failed: ${error.message}`));
+            this.process = null;
+        });
+        this.process.stdin.on('error', (error) => {
+            this.failAll(new Error(`Could not send the job to decodeWorker.py: ${error.message}`));
+        });
+
+        this.process.on('close', (code) => {
+            if (code !== 0) {
+                console.error(`decodeWorker.py exited with code ${code}`);
+            }
+            this.failAll(new Error('decodeWorker.py exited before finishing the job'));
+            this.process = null;
+        });
+    }
+
+    failAll(error) {
+        for (const job of this.pending.values()) {
+            job.reject(error);
+        }
+        this.pending.clear();
+    }
+
+    handle(message) {
+        const job = this.pending.get(message.id);
+        if (!job) {
+            return;
+        }
+        if (message.type === 'image') {
+            if (message.error) {
+                console.error(`Skipping image ${message.image} of ${job.tplPath}: ${message.error}`);
+            } else {
+                console.log(`decodeWorker.py: wrote ${message.path}`);
+            }
+        } else if (message.type === 'done') {
+            this.pending.delete(message.id);
+            job.resolve(message);
+        } else if (message.type === 'error') {
+            this.pending.delete(message.id);
+            job.reject(new Error(message.error));
+        }
+    }
+
+    /**
+     * Extracts every image of a TPL file.
+     * @param {string} tplPath - The TPL file.
+     * @param {string} outputDir - The folder the images are written to.
+     * @param {Object} options - Extract options (png_palette, mips, dds, cache, cache_size, ...).
+     * @returns {Promise<Object>} The worker's "done" message.
+     */
+    extract(tplPath, outputDir = 'tex', options = {}) {
+        if (!this.process) {
+            this.start();
+        }
+        const id = this.nextId++;
+        const payload = Buffer.from(JSON.stringify({ id, path: tplPath, output_dir: outputDir, options }), 'utf8');
+        const header = Buffer.alloc(4);
+        header.writeUInt32BE(payload.length, 0);
+        // Registered before writing, so a failed write can reject it
+        const job = new Promise((resolve, reject) => {
+            this.pending.set(id, { tplPath, resolve, reject });
+        });
+        this.process.stdin.write(Buffer.concat([header, payload]));
+        return job;
+    }
+
+    /**
+     * Lets the worker exit once its queued jobs are done.
+     */
+    close() {
+        if (this.process) {
+            this.process.stdin.end();
+        }
+    }
+}
+
+const decodeWorker = new DecodeWorker();
+
 /**
  * Processes the binary .d file.
  * @param {string} filePath - The path to the file.
- * @param {boolean} runImageStream - Whether to run imageStream.py.
+ * @param {boolean} runImageStream - Whether to extract the model's textures.
+ * @returns {Promise} Settles once the textures are extracted.
  */
 function processFile(filePath, runImageStream) {
+    let extraction = Promise.resolve();
     try {
         console.log(filePath);
 
         if (runImageStream) {
-            // Extract images:
-            const pythonScript = path.join(__dirname, 'imageStream.py');
-            const argument = `${filePath}-`;
-
-            console.log(`Running imageStream.py with argument: ${argument}`);
+            // Extract images on the shared worker process, into the model's own
+            // folder so its manifest (and unchanged images) survive other models' runs:
+            const tplPath = `${filePath}-`;
+            const outputDir = path.join('tex', path.basename(filePath, path.extname(filePath)));
 
-            // Spawn the Python process
-            const pythonProcess = spawn('py', [pythonScript, argument]);
+            console.log(`Extracting textures from: ${tplPath} into ${outputDir}`);
 
-            pythonProcess.stdout.on('data', (data) => {
-                console.log(`imageStream.py: ${data}`);
-            });
-
-            pythonProcess.stderr.on('data', (data) => {
-                console.error(`imageStream.py ERROR: ${data}`);
-            });
-
-            pythonProcess.on('close', (code) => {
-                if (code !== 0) {
-                    console.error(`imageStream.py exited with code ${code}`);
-                }
+            extraction = decodeWorker.extract(tplPath, outputDir).then((result) => {
+                console.log(`Extracted ${result.images - result.failed} of ${result.images} images (${result.unchanged} unchanged) in ${result.seconds.toFixed(2)}s`);
+            }, (error) => {
+                console.error(`Texture extraction failed: ${error.message}`);
             });
         } else {
-            console.log("Skipping imageStream.py execution.");
+            console.log("Skipping texture extraction.");
         }
 
         // Read the binary file as a buffer
@@ -50,6 +157,7 @@ function processFile(filePath, runImageStream) {
 
         // Call loadEvent with the ArrayBuffer
         loadEvent({ result: arrayBuffer });
+        return extraction;
     } catch (error) {
         console.error("Error reading file:", error);
         console.error(error.stack);
@@ -115,7 +223,8 @@ async function main() {
     const binaryFilePath = args[0];
     const runImageStream = args.length > 1 ? args[1].toLowerCase() !== "false" : true;
 
-    processFile(binaryFilePath, runImageStream);
+    await processFile(binaryFilePath, runImageStream);
+    decodeWorker.close();
 }
 
 // Run the main function
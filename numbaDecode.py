@@ -0,0 +1,255 @@
+import importlib.util
+import numpy as np
+
+import colorTables
+
+# Optional Numba backend: loop-style decoders for the direct-color formats
+# and CMPR, compiled on first use. They walk the tiles in file order and
+# write each texel straight to its place in the image, so deswizzling,
+# edge cropping and CMPR's index expansion need no intermediate arrays.
+# Texel values are converted through the same colorTables tables as the
+# NumPy decoders (RGB5A3's mode switch included), and CMPR palettes use
+# decode.cmpr_palettes' integer formulas, so output is byte-identical.
+# Compiled code is cached on disk (__pycache__), so only the first run
+# after installing Numba or editing this file pays for the JIT.
+# Importing Numba alone takes a few hundred ms, so it only happens on the
+# first kernel()/preview_kernel() call: runs that never pick a Numba
+# decoder don't pay for it.
+#
+# kernel(format_str) takes the validated tiled bytes (see decode.read_tiles)
+# as a flat uint8 array and returns a (height, width, 4) uint8 RGBA image.
+
+# Installed, judging by its package; cleared if importing it fails after all
+AVAILABLE = importlib.util.find_spec("numba") is not None
+
+# Formats kernel() has a kernel for
+KERNEL_FORMATS = ('I4', 'I8', 'IA4', 'IA8', 'RGB565', 'RGB5A3', 'RGBA32', 'CMPR')
+
+# Names of the @_jit functions, compiled in place by _load()
+_JITTED = []
+_loaded = False
+
+def _jit(kernel):
+    _JITTED.append(kernel.__name__)
+    return kernel
+
+def _load():
+    # Import Numba and swap every @_jit function for its compiled version.
+    # Kernels call each other through these module globals, which Numba
+    # resolves when a kernel is first compiled, i.e. after this has run
+    global AVAILABLE, _loaded
+    if _loaded:
+        return AVAILABLE
+    _loaded = True
+    try:
+        import numba
+    except ImportError:
+        AVAILABLE = False
+        return False
+    for name in _JITTED:
+        globals()[name] = numba.njit(cache=True, nogil=True)(globals()[name])
+    return True
+
+@_jit
+def _decode_tiled(raw, height, width, tile_w, tile_h, texel, words):
+    # Tiles of texels that are looked up in words (a colorTables table as one
+    # uint32 RGBA word per entry): texel 1 => byte indices, 2 => big-endian
+    # 16-bit indices. texel 0 => raw already holds RGBA words (RGBA32), copied as is
+    image = np.empty((height, width), dtype=np.uint32)
+    tiles_x = (width + tile_w - 1) // tile_w
+    tiles_y = (height + tile_h - 1) // tile_h
+    step = 2 if texel == 2 else 1
+    pos = 0
+    for ty in range(tiles_y):
+        for tx in range(tiles_x):
+            for py in range(tile_h):
+                y = ty * tile_h + py
+                for px in range(tile_w):
+                    x = tx * tile_w + px
+                    if y < height and x < width:
+                        if texel == 1:
+                            image[y, x] = words[raw[pos]]
+                        elif texel == 2:
+                            image[y, x] = words[(np.int64(raw[pos]) << 8) | raw[pos + 1]]
+                        else:
+                            image[y, x] = raw[pos]
+                    pos += step
+    return image
+
+@_jit
+def _decode_I4(raw, height, width, words):
+    # 8x8 tiles, two texels per byte (first in the top nibble); words holds
+    # i4_pair_table's two texels per byte value
+    image = np.empty((height, width), dtype=np.uint32)
+    tiles_x = (width + 7) // 8
+    tiles_y = (height + 7) // 8
+    pos = 0
+    for ty in range(tiles_y):
+        for tx in range(tiles_x):
+            for py in range(8):
+                y = ty * 8 + py
+                for px in range(0, 8, 2):
+                    if y < height:
+                        x = tx * 8 + px
+                        if x < width:
+                            image[y, x] = words[raw[pos], 0]
+                        if x + 1 < width:
+                            image[y, x + 1] = words[raw[pos], 1]
+                    pos += 1
+    return image
+
+@_jit
+def _cmpr_palette(raw, pos, palette):
+    # The RGBA palette of the CMPR sub-block at raw[pos:pos + 8], as decode.cmpr_palettes builds it
+    c0 = (np.uint32(raw[pos]) << 8) | raw[pos + 1]
+    c1 = (np.uint32(raw[pos + 2]) << 8) | raw[pos + 3]
+    for k in range(2):
+        c = c0 if k == 0 else c1
+        palette[k, 0] = ((c >> 11) & 0x1F) * 255 // 31
+        palette[k, 1] = ((c >> 5) & 0x3F) * 255 // 63
+        palette[k, 2] = (c & 0x1F) * 255 // 31
+        palette[k, 3] = 255
+    for ch in range(3):
+        v0 = palette[0, ch]
+        v1 = palette[1, ch]
+        if c0 > c1:
+            palette[2, ch] = (2 * v0 + v1) // 3
+            palette[3, ch] = (v0 + 2 * v1) // 3
+        else:
+            palette[2, ch] = (v0 + v1) // 2
+            palette[3, ch] = 0
+    palette[2, 3] = 255
+    palette[3, 3] = 255 if c0 > c1 else 0
+
+@_jit
+def _decode_CMPR(raw, height, width):
+    # 8x8 macro-blocks of four 8-byte DXT1 sub-blocks (see decode.decode_CMPR)
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    palette = np.empty((4, 4), dtype=np.uint32)
+    blocks_wide = (width + 7) // 8
+    blocks_high = (height + 7) // 8
+    pos = 0
+    for by in range(blocks_high):
+        for bx in range(blocks_wide):
+            for sub in range(4):
+                y0 = by * 8 + (sub >> 1) * 4
+                x0 = bx * 8 + (sub & 1) * 4
+                if y0 >= height or x0 >= width:
+                    pos += 8
+                    continue
+
+                _cmpr_palette(raw, pos, palette)
+                for row in range(4):
+                    y = y0 + row
+                    bits = raw[pos + 4 + row]
+                    if y >= height:
+                        continue
+                    for col in range(4):
+                        x = x0 + col
+                        if x < width:
+                            index = (bits >> (6 - 2 * col)) & 0x03
+                            for ch in range(4):
+                                image[y, x, ch] = palette[index, ch]
+                pos += 8
+    return image
+
+@_jit
+def _preview_CMPR(raw, height, width):
+    # One pixel per sub-block: its in-image texels' palette colors, averaged (see decode.preview_CMPR)
+    preview_h = (height + 3) // 4
+    preview_w = (width + 3) // 4
+    preview = np.empty((preview_h, preview_w, 4), dtype=np.uint8)
+    palette = np.empty((4, 4), dtype=np.uint32)
+    counts = np.empty(4, dtype=np.uint32)
+    blocks_wide = (width + 7) // 8
+    blocks_high = (height + 7) // 8
+    pos = 0
+    for by in range(blocks_high):
+        for bx in range(blocks_wide):
+            for sub in range(4):
+                py = by * 2 + (sub >> 1)
+                px = bx * 2 + (sub & 1)
+                if py >= preview_h or px >= preview_w:
+                    pos += 8
+                    continue
+                _cmpr_palette(raw, pos, palette)
+
+                rows = min(4, height - py * 4)
+                cols = min(4, width - px * 4)
+                counts[:] = 0
+                if rows == 4 and cols == 4:
+                    # Whole sub-block: all 16 indices, and a shift for the average
+                    for row in range(4):
+                        bits = raw[pos + 4 + row]
+                        counts[bits >> 6] += 1
+                        counts[(bits >> 4) & 0x03] += 1
+                        counts[(bits >> 2) & 0x03] += 1
+                        counts[bits & 0x03] += 1
+                    for ch in range(4):
+                        acc = (counts[0] * palette[0, ch] + counts[1] * palette[1, ch]
+                               + counts[2] * palette[2, ch] + counts[3] * palette[3, ch])
+                        preview[py, px, ch] = (acc + 8) >> 4
+                    pos += 8
+                    continue
+                for row in range(rows):
+                    bits = raw[pos + 4 + row]
+                    for col in range(cols):
+                        counts[(bits >> (6 - 2 * col)) & 0x03] += 1
+                total = rows * cols
+                for ch in range(4):
+                    acc = 0
+                    for k in range(4):
+                        acc += counts[k] * palette[k, ch]
+                    preview[py, px, ch] = (acc + total // 2) // total
+                pos += 8
+    return preview
+
+def _words(table):
+    # A colorTables table as one native uint32 word per entry (per texel for pair tables)
+    return table.reshape(table.shape[:-1] + (-1,)).view(np.uint32)[..., 0]
+
+def _tiled(tile_w, tile_h, texel, table=None):
+    def decode(raw, height, width):
+        words = _words(table()) if table else np.zeros(1, dtype=np.uint32)
+        if texel == 0:
+            raw = raw.view(np.uint32)
+        return _decode_tiled(raw, height, width, tile_w, tile_h, texel, words)
+    return decode
+
+# kernel()'s functions, by format
+_kernels = {}
+
+def kernel(format_str):
+    """
+    A function(raw, height, width) decoding format_str with Numba, or None
+    when Numba isn't installed or the format has no kernel (the palette
+    formats, whose cost is the NumPy palette gather either way).
+    """
+    if format_str in _kernels:
+        return _kernels[format_str]
+    if not AVAILABLE or format_str not in KERNEL_FORMATS or not _load():
+        return None
+    kernels = {
+        'I4': lambda raw, height, width: _decode_I4(raw, height, width, _words(colorTables.i4_pair_table())),
+        'I8': _tiled(8, 4, 1, colorTables.i8_table),
+        'IA4': _tiled(8, 4, 1, colorTables.ia4_table),
+        'IA8': _tiled(4, 4, 2, colorTables.ia8_table),
+        'RGB565': _tiled(4, 4, 2, colorTables.rgb565_table),
+        'RGB5A3': _tiled(4, 4, 2, colorTables.rgb5a3_table),
+        'RGBA32': _tiled(4, 4, 0),
+        'CMPR': _decode_CMPR,
+    }
+    kernel = kernels[format_str]
+    # Kernels build the image as uint32 RGBA words (CMPR as bytes)
+    _kernels[format_str] = lambda raw, height, width: kernel(raw, height, width).view(np.uint8).reshape(height, width, 4)
+    return _kernels[format_str]
+
+def preview_kernel(format_str):
+    """
+    A function(raw, height, width) building decode.decode_preview's CMPR
+    preview with Numba, or None (for other formats the NumPy preview
+    already touches only one texel in 16).
+    """
+    if not AVAILABLE or format_str != 'CMPR' or not _load():
+        return None
+    return _preview_CMPR
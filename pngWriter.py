@@ -0,0 +1,101 @@
+import os
+import zlib
+import struct
+import numpy as np
+
+import savePipeline
+
+# Minimal PNG writer that takes an RGBA image a few rows at a time, so the
+# whole image never has to be in memory (see decode.stream_to_png). Rows are
+# Up-filtered and deflated as they arrive; only the previous row is kept.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_FILTER_UP = 2
+
+# Compressed data is written out in IDAT chunks of at least this size
+IDAT_CHUNK_SIZE = 64 * 1024
+
+class PNGWriter:
+    """
+    Write a width x height 8-bit RGBA PNG from successive (rows, width, 4)
+    uint8 strips:
+        with PNGWriter("i-1.png", width, height) as png:
+            for strip in strips:
+                png.write_rows(strip)
+    """
+
+    def __init__(self, path, width, height, compress_level=savePipeline.PNG_COMPRESS_LEVEL):
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.path = path
+        self.file = open(path, "wb")
+        self.compressor = zlib.compressobj(compress_level)
+        self.pending = []
+        self.pending_size = 0
+        self.prev_row = np.zeros((1, width * 4), dtype=np.uint8)
+
+        self.file.write(PNG_SIGNATURE)
+        # 8 bits per channel, color type 6 (RGBA), deflate, adaptive filtering, no interlace
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def _chunk(self, chunk_type, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def _deflate(self, data):
+        data = self.compressor.compress(data)
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+        if self.pending_size >= IDAT_CHUNK_SIZE:
+            self._flush_idat()
+
+    def _flush_idat(self):
+        if self.pending:
+            self._chunk(b"IDAT", b"".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def write_rows(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(-1, self.width * 4)
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError(f"PNG is {self.height} rows high, got {self.rows_written + len(rows)}.")
+        if not len(rows):
+            return
+
+        # Up filter: each byte minus the one above it (wrapping), the first row against the previous strip's last
+        filtered = np.empty((len(rows), 1 + self.width * 4), dtype=np.uint8)
+        filtered[:, 0] = PNG_FILTER_UP
+        np.subtract(rows[:1], self.prev_row, out=filtered[:1, 1:])
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        self.prev_row = rows[-1:].copy()
+        self.rows_written += len(rows)
+        self._deflate(filtered.tobytes())
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"PNG is {self.height} rows high, only {self.rows_written} were written.")
+            tail = self.compressor.flush()
+            if tail:
+                self.pending.append(tail)
+            self._flush_idat()
+            self._chunk(b"IEND", b"")
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't leave a truncated PNG behind
+            self.file.close()
+            os.remove(self.path)
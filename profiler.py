@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+import tracemalloc
+import contextlib
+
+# Per-stage / per-image profiling for --profile. The report is written in the
+# Chrome trace-event JSON object format, so it loads directly into
+# chrome://tracing or Perfetto; the extra "images" and "stages" keys hold the
+# per-image and aggregated numbers for scripts.
+
+def _now_us():
+    # perf_counter is system-wide monotonic, so worker and parent timestamps line up
+    return time.perf_counter_ns() / 1000
+
+class ImageRecorder:
+    """
+    Records stage timings, bytes read/written and peak traced memory for one
+    image. Created inside the (worker) process that decodes the image; only
+    the plain dict from summary() is sent back to the parent.
+    peak_bytes is tracemalloc's process-wide peak since the image started,
+    so it includes earlier images' saves still running on savePipeline
+    threads meanwhile: an upper bound for the image, not its own footprint.
+    """
+
+    def __init__(self, name, bytes_read=0):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.name = name
+        self.bytes_read = bytes_read
+        self.bytes_written = 0
+        self.stages = {}
+        self.events = []
+        self.start = _now_us()
+        self.end = None
+        self.peak_bytes = None
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        start = _now_us()
+        try:
+            yield
+        finally:
+            dur = _now_us() - start
+            self.stages[stage] = self.stages.get(stage, 0) + dur / 1e6
+            self.events.append(trace_event(stage, "image", start, dur, {"image": self.name}))
+
+    def wrote(self, path):
+        try:
+            self.bytes_written += os.path.getsize(path)
+        except OSError:
+            pass
+
+    def finish(self):
+        """
+        Mark the image done. Its save may complete on another thread after
+        the next image has started (see savePipeline), so summary() reports
+        up to this point rather than up to when it's called.
+        """
+        if self.end is None:
+            self.end = _now_us()
+            _, self.peak_bytes = tracemalloc.get_traced_memory()
+
+    def summary(self):
+        self.finish()
+        dur = self.end - self.start
+        self.events.append(trace_event("image", "image", self.start, dur, {"image": self.name}))
+        return {
+            "image": self.name,
+            "seconds": dur / 1e6,
+            "stages": self.stages,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_bytes": self.peak_bytes,
+            "events": self.events,
+        }
+
+def span(recorder, stage):
+    """
+    recorder.span(stage), or a no-op when profiling is off (recorder is None).
+    """
+    if recorder is None:
+        return contextlib.nullcontext()
+    return recorder.span(stage)
+
+def trace_event(name, cat, start_us, dur_us, args=None, pid=None):
+    # One track per thread: saves on savePipeline threads overlap the next image's spans
+    pid = pid if pid is not None else os.getpid()
+    return {"name": name, "cat": cat, "ph": "X", "ts": start_us, "dur": dur_us,
+            "pid": pid, "tid": threading.get_ident(), "args": args or {}}
+
+class RunProfile:
+    """
+    Collects the parent's run-level spans and every image's summary, then
+    writes the combined report.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.images = []
+        self.start = _now_us()
+
+    @contextlib.contextmanager
+    def span(self, stage, **args):
+        start = _now_us()
+        try:
+            yield
+        finally:
+            self.events.append(trace_event(stage, "run", start, _now_us() - start, args))
+
+    def add_image(self, summary):
+        self.events.extend(summary.pop("events"))
+        self.images.append(summary)
+
+    def report(self):
+        stages = {}
+        for image in self.images:
+            for stage, seconds in image["stages"].items():
+                stages[stage] = stages.get(stage, 0) + seconds
+        for event in self.events:
+            if event["cat"] == "run":
+                stages[event["name"]] = stages.get(event["name"], 0) + event["dur"] / 1e6
+
+        pids = sorted({event["pid"] for event in self.events})
+        metadata = [{"name": "process_name", "ph": "M", "pid": pid, "tid": pid,
+                     "args": {"name": "main" if pid == os.getpid() else f"worker {pid}"}} for pid in pids]
+        return {
+            "traceEvents": metadata + self.events,
+            "displayTimeUnit": "ms",
+            "seconds": (_now_us() - self.start) / 1e6,
+            "stages": stages,
+            "bytes_read": sum(image["bytes_read"] for image in self.images),
+            "bytes_written": sum(image["bytes_written"] for image in self.images),
+            "peak_bytes": max((image["peak_bytes"] for image in self.images), default=0),
+            "images": self.images,
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f)
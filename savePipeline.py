@@ -0,0 +1,75 @@
+import threading
+import concurrent.futures
+
+# Overlaps writing outputs with decoding. The decode loop hands each decoded
+# image's save (PNG encode + write) to a small thread pool and moves on to
+# the next image; zlib releases the GIL while deflating, so the two really
+# run at the same time even on one core's worth of Python. At most
+# threads * PENDING_PER_THREAD saves are queued or running; submit() blocks
+# past that, so decoded images never pile up faster than they're written.
+
+DEFAULT_THREADS = 2
+PENDING_PER_THREAD = 2
+
+# zlib level PNGs are written at unless options say otherwise (Pillow's default)
+PNG_COMPRESS_LEVEL = 6
+
+class SavePipeline:
+    """
+    Run save jobs on `threads` background threads:
+        with SavePipeline(2) as saver:
+            for image in images:
+                saver.submit(save, image)
+    Leaving the block (or close()) waits for every job and re-raises the
+    first exception any of them raised. With threads=0 jobs run inline.
+    """
+
+    def __init__(self, threads=DEFAULT_THREADS, max_pending=None):
+        self.threads = max(0, threads)
+        self.executor = None
+        if self.threads:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="save")
+        self.slots = threading.BoundedSemaphore(max_pending or max(1, self.threads) * PENDING_PER_THREAD)
+        self.error = None
+
+    def submit(self, job, *args):
+        if self.error is not None:
+            self.close()
+        if not self.executor:
+            job(*args)
+            return
+        # Backpressure: wait for a slot before taking on another image
+        self.slots.acquire()
+        try:
+            self.executor.submit(self._run, job, args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def _run(self, job, args):
+        try:
+            job(*args)
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+        finally:
+            self.slots.release()
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        elif self.executor:
+            # Already failing: let queued saves finish, but don't mask the original error
+            self.executor.shutdown(wait=True)
+            self.executor = None
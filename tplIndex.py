@@ -0,0 +1,198 @@
+import os
+import sys
+import sqlite3
+import argparse
+
+import imageStream
+import decodeCache
+
+# Header-only index of TPL textures in a local SQLite database. Scanning
+# reads only the headers plus the bytes hashed for duplicate detection, and
+# imports neither NumPy nor Pillow. Files whose size and mtime haven't
+# changed since the last scan are skipped, so rescanning a tree is cheap
+# and queries never touch the TPLs again.
+#   python tplIndex.py inspect a
+#   python tplIndex.py query --format RGB5A3 --min-width 256
+#   python tplIndex.py query --duplicates
+
+DEFAULT_INDEX = ".tplindex.sqlite"
+# Stored as the database's user_version; indexes from other versions are rebuilt
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    n_images INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    img_index INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    wrap_s INTEGER, wrap_t INTEGER,
+    min_filter INTEGER, mag_filter INTEGER,
+    lod_bias REAL, edge_lod_enable INTEGER, min_lod INTEGER, max_lod INTEGER,
+    palette_format TEXT, palette_entries INTEGER,
+    data_addr INTEGER NOT NULL,
+    data_size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (path, img_index)
+);
+CREATE INDEX IF NOT EXISTS images_hash ON images(hash);
+CREATE INDEX IF NOT EXISTS images_format ON images(format, width, height);
+"""
+
+IMAGE_COLUMNS = ("path", "img_index", "format", "width", "height", "wrap_s", "wrap_t", "min_filter", "mag_filter",
+                 "lod_bias", "edge_lod_enable", "min_lod", "max_lod", "palette_format", "palette_entries",
+                 "data_addr", "data_size", "hash")
+
+def open_index(db_path=DEFAULT_INDEX):
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    if db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        # Older indexes hashed images differently: rescan every file
+        with db:
+            db.execute("DELETE FROM files")
+        db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+    return db
+
+def image_hash(buffer, image):
+    """
+    Content hash of one image: decodeCache.image_key of its base level bytes,
+    palette and format/size, so equal hashes mean identical textures and
+    match the decode cache's and extraction manifests' keys.
+    """
+    palette = None
+    if image.palette_addr is not None:
+        palette = (imageStream.get_palette_data(buffer, image), image.palette_format)
+    return decodeCache.image_key(imageStream.get_image_data(buffer, image), image.format_name,
+                                 image.height, image.width, palette)
+
+def index_file(db, tpl_file, stat):
+    """
+    Replace the rows of one TPL file with freshly parsed ones.
+    """
+    with open(tpl_file, "rb") as file:
+        buffer = imageStream.map_tpl(file)
+    try:
+        headers = imageStream.parse_tpl(buffer)
+        rows = [(tpl_file, img_idx + 1, image.format_name, image.width, image.height, image.wrap_s, image.wrap_t,
+                 image.min_filter, image.mag_filter, image.lod_bias, image.edge_lod_enable, image.min_lod,
+                 image.max_lod, image.palette_format, image.palette_entries, image.data_addr, image.data_size,
+                 image_hash(buffer, image))
+                for img_idx, image in enumerate(headers)]
+    finally:
+        buffer.close()
+
+    db.execute("DELETE FROM files WHERE path = ?", (tpl_file,))
+    db.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (tpl_file, stat.st_size, stat.st_mtime_ns, len(rows)))
+    db.executemany(f"INSERT INTO images VALUES ({', '.join('?' * len(IMAGE_COLUMNS))})", rows)
+
+def scan(db, path):
+    """
+    Index every TPL under a directory (or matching a glob, or a single file).
+    Unchanged files are skipped and files that disappeared from under the
+    scanned directory are dropped. Returns (indexed, skipped, removed) counts.
+    """
+    if os.path.isfile(path):
+        tpl_files = [path] if imageStream.is_tpl_file(path) else []
+    else:
+        tpl_files, _ = imageStream.find_tpl_files(path)
+    tpl_files = [os.path.abspath(tpl_file) for tpl_file in tpl_files]
+
+    known = {row["path"]: (row["size"], row["mtime_ns"]) for row in db.execute("SELECT path, size, mtime_ns FROM files")}
+    indexed = skipped = removed = 0
+    with db:
+        for tpl_file in tpl_files:
+            stat = os.stat(tpl_file)
+            if known.get(tpl_file) == (stat.st_size, stat.st_mtime_ns):
+                skipped += 1
+                continue
+            try:
+                index_file(db, tpl_file, stat)
+            except (ValueError, OSError) as e:
+                print(f"Skipping {tpl_file}: {e}")
+                continue
+            indexed += 1
+
+        if os.path.isdir(path):
+            root = os.path.join(os.path.abspath(path), "")
+            found = set(tpl_files)
+            stale = [(tpl_file,) for tpl_file in known if tpl_file.startswith(root) and tpl_file not in found]
+            db.executemany("DELETE FROM files WHERE path = ?", stale)
+            removed = len(stale)
+    return indexed, skipped, removed
+
+def query(db, format=None, min_width=None, min_height=None, wrap=None, duplicates=False):
+    """
+    Indexed images matching every given filter, ordered by path and index.
+    With duplicates, only images whose content appears more than once.
+    """
+    where, params = [], []
+    if format:
+        where.append("format = ?")
+        params.append(format)
+    if min_width:
+        where.append("width >= ?")
+        params.append(min_width)
+    if min_height:
+        where.append("height >= ?")
+        params.append(min_height)
+    if wrap is not None:
+        where.append("(wrap_s = ? OR wrap_t = ?)")
+        params += [wrap, wrap]
+    if duplicates:
+        where.append("hash IN (SELECT hash FROM images GROUP BY hash HAVING COUNT(*) > 1)")
+    sql = "SELECT * FROM images"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    order = "hash, path, img_index" if duplicates else "path, img_index"
+    return db.execute(f"{sql} ORDER BY {order}", params).fetchall()
+
+def format_row(row):
+    palette = f" {row['palette_format']}[{row['palette_entries']}]" if row["palette_format"] else ""
+    return (f"{row['path']}#{row['img_index']}\t{row['format']}{palette}\t{row['width']}x{row['height']}\t"
+            f"wrap {row['wrap_s']},{row['wrap_t']}\tfilter {row['min_filter']},{row['mag_filter']}\t"
+            f"lod {row['min_lod']}-{row['max_lod']}\t{row['hash']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index TPL texture metadata (no decoding) in a SQLite database and query it.")
+    parser.add_argument("--index", type=str, default=DEFAULT_INDEX, metavar="DB", help=f"The index database (default: {DEFAULT_INDEX}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    inspect_parser = commands.add_parser("inspect", help="Scan a TPL file, directory or glob into the index.")
+    inspect_parser.add_argument("path", type=str, help="The TPL file, directory or glob to scan.")
+
+    query_parser = commands.add_parser("query", help="List indexed images matching the given filters.")
+    query_parser.add_argument("--format", type=str, default=None, choices=sorted(imageStream.FORMAT_MAP.values()))
+    query_parser.add_argument("--min-width", type=int, default=None, metavar="PX")
+    query_parser.add_argument("--min-height", type=int, default=None, metavar="PX")
+    query_parser.add_argument("--wrap", type=int, default=None, help="Wrap mode on either axis (0 clamp, 1 repeat, 2 mirror).")
+    query_parser.add_argument("--duplicates", action="store_true", help="Only images whose content appears more than once.")
+    query_parser.add_argument("--sql", type=str, default=None, help="Run this SQL against the index instead (tables: files, images).")
+    args = parser.parse_args()
+
+    db = open_index(args.index)
+    if args.command == "inspect":
+        if not imageStream.is_batch_path(args.path) and not os.path.exists(args.path):
+            print(f"Error: The file {args.path} does not exist.")
+            sys.exit(1)
+        indexed, skipped, removed = scan(db, args.path)
+        n_files, n_images, n_unique = db.execute(
+            "SELECT (SELECT COUNT(*) FROM files), COUNT(*), COUNT(DISTINCT hash) FROM images").fetchone()
+        print(f"Indexed {indexed} files ({skipped} unchanged, {removed} removed); "
+              f"{n_files} files, {n_images} images ({n_unique} unique) in {args.index}")
+    elif args.sql:
+        for row in db.execute(args.sql):
+            print("\t".join(str(value) for value in row))
+    else:
+        rows = query(db, args.format, args.min_width, args.min_height, args.wrap, args.duplicates)
+        for row in rows:
+            print(format_row(row))
+        print(f"{len(rows)} images")
+    db.close()